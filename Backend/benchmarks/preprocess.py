@@ -0,0 +1,79 @@
+"""
+Preprocessing micro-benchmark: naive full-resolution decode vs the draft-mode
+pipeline with pooled buffers (model/preprocess.py), on a synthetic phone photo.
+
+Run from the Backend directory:
+    python -m benchmarks.preprocess [iterations]
+
+`peak alloc` is the tracemalloc peak per image: NumPy arrays and Python
+objects (the decoded upload bytes included), not Pillow's internal decoder
+buffers.
+"""
+from PIL import Image, ImageOps
+import numpy as np
+
+import base64
+import io
+import sys
+import time
+import tracemalloc
+
+from model.preprocess import INPUT_SIZE, MEAN, STD, preprocess
+
+def make_photo(width: int = 4032, height: int = 3024) -> str:
+    """12MP JPEG with an EXIF rotation tag, base64-encoded like the app sends it"""
+    rng = np.random.default_rng(0)
+    # Smooth gradient + noise compresses like a real photo, unlike pure noise
+    y, x = np.mgrid[0:height, 0:width]
+    pixels = np.stack([(x * 255 // width), (y * 255 // height), ((x + y) * 255 // (width + height))], axis=-1)
+    pixels = (pixels + rng.integers(0, 16, pixels.shape)).clip(0, 255).astype(np.uint8)
+
+    exif = Image.Exif()
+    exif[0x0112] = 6  # rotated 90 degrees
+    buf = io.BytesIO()
+    Image.fromarray(pixels).save(buf, "JPEG", quality=90, exif=exif)
+    return base64.b64encode(buf.getvalue()).decode("ascii")
+
+def naive(image_data: str) -> np.ndarray:
+    img = Image.open(io.BytesIO(base64.b64decode(image_data)))
+    img = ImageOps.exif_transpose(img).convert("RGB")
+    img = ImageOps.fit(img, (INPUT_SIZE, INPUT_SIZE), Image.BILINEAR)
+    arr = np.array(img).astype(np.float32) / 255.0
+    arr = (arr - MEAN) / STD
+    return arr.transpose(2, 0, 1).copy()
+
+def pipeline(image_data: str) -> float:
+    with preprocess(image_data) as x:
+        return float(x[0, 0, 0])
+
+def measure(label: str, fn, image_data: str, iterations: int):
+    fn(image_data)  # warm up
+
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn(image_data)
+    per_image_ms = (time.perf_counter() - started) / iterations * 1000
+
+    tracemalloc.start()
+    fn(image_data)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"{label:<10} {per_image_ms:8.2f} ms/image  peak alloc {peak / 1024:9.1f} KiB")
+
+def preprocess_copy(image_data: str) -> np.ndarray:
+    with preprocess(image_data) as x:
+        return x.copy()
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    image_data = make_photo()
+    print(f"input: {len(image_data) / 1024 / 1024:.1f} MiB base64, model input {INPUT_SIZE}x{INPUT_SIZE}")
+
+    assert np.allclose(naive(image_data), preprocess_copy(image_data), atol=0.05), "pipelines disagree"
+
+    measure("naive", naive, image_data, iterations)
+    measure("pipeline", pipeline, image_data, iterations)
+
+if __name__ == "__main__":
+    main()
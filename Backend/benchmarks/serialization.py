@@ -0,0 +1,79 @@
+"""
+Serialization micro-benchmark: the old raw-ORM / jsonable_encoder path against
+the typed response models rendered with orjson.
+
+Run from the Backend directory:
+    python -m benchmarks.serialization [iterations]
+"""
+import os
+
+# The routers import the engine at module load; no database is touched here
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from datetime import datetime
+import json
+import sys
+import timeit
+
+import orjson
+
+from model.model import User
+from routing.profile import UserOut, BadgeOut
+
+def make_user(i: int) -> User:
+    return User(
+        id=i,
+        name=f"User {i}",
+        first_name="Eco",
+        last_name="Sorter",
+        address="221B Baker Street, London",
+        email=f"user{i}@example.com",
+        password_hash="$2b$12$" + "x" * 53,
+        reset_token="t" * 43,
+        reset_token_expires=datetime(2024, 1, 1, 12, 0),
+        created_at=datetime(2024, 1, 1, 12, 0),
+    )
+
+def old_user(user: User) -> bytes:
+    # What FastAPI did for handlers returning the ORM object without a response_model
+    return json.dumps(jsonable_encoder(user)).encode("utf-8")
+
+def old_dict(user: User) -> bytes:
+    # Hand-built dicts with str(created_at) rendered through the default JSONResponse
+    body = {"id": user.id, "name": user.name, "email": user.email, "created_at": str(user.created_at)}
+    return json.dumps(jsonable_encoder(body), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+user_adapter = TypeAdapter(UserOut)
+
+def new_user(user: User) -> bytes:
+    model = user_adapter.validate_python(user, from_attributes=True)
+    return orjson.dumps(model.model_dump(mode="json"))
+
+badges = [{"name": f"Badge {i}", "earned": i % 2 == 0, "awarded_at": datetime(2024, 1, 1), "reason": "10 items scanned"} for i in range(20)]
+badges_adapter = TypeAdapter(list[BadgeOut])
+
+def old_badges() -> bytes:
+    return json.dumps(jsonable_encoder(badges), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def new_badges() -> bytes:
+    return orjson.dumps(badges_adapter.dump_python(badges_adapter.validate_python(badges), mode="json"))
+
+def bench(label: str, fn, iterations: int):
+    seconds = min(timeit.repeat(fn, number=iterations, repeat=5))
+    size = len(fn())
+    print(f"{label:<28} {seconds / iterations * 1e6:8.2f} us/op  {size:6d} bytes")
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    user = make_user(1)
+
+    bench("user: ORM + jsonable_encoder", lambda: old_user(user), iterations)
+    bench("user: dict + jsonable_encoder", lambda: old_dict(user), iterations)
+    bench("user: UserOut + orjson", lambda: new_user(user), iterations)
+    bench("badges: jsonable_encoder", old_badges, iterations)
+    bench("badges: BadgeOut + orjson", new_badges, iterations)
+
+if __name__ == "__main__":
+    main()
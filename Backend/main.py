@@ -1,14 +1,22 @@
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from routing.auth import router as auth_router
+from routing.auth import router as auth_router, reset_token_sweeper
 from routing.profile import router as profile_router
 from routing.Recycle_center import router as recycle_router
 from routing.classify import router as classify_router
-from model.connect import engine
-from model.model import Base
+from routing.classify_stream import router as classify_stream_router
+from routing.admission import AdmissionMiddleware
+from routing.compression import CompressionMiddleware
+from routing.consistency import ReadYourWritesMiddleware, READ_YOUR_WRITES_HEADER
+from model.connect import engine, SessionLocal
+from model.badges import seed_default_badges
+from model.geocoding import geocode_backfill_loop, GEOCODE_BACKFILL_SECONDS
+from model.model import Base, RecyclingCenter
 from dotenv import load_dotenv
 from sqlalchemy import text
 import uvicorn
+import asyncio
 
 # Load environment from .env
 load_dotenv()
@@ -43,6 +51,10 @@ def ensure_user_columns():
                 alter_stmts.append("ALTER TABLE users ADD COLUMN reset_token VARCHAR(255);")
             if "reset_token_expires" not in cols:
                 alter_stmts.append("ALTER TABLE users ADD COLUMN reset_token_expires DATETIME;")
+            if "latitude" not in cols:
+                alter_stmts.append("ALTER TABLE users ADD COLUMN latitude FLOAT;")
+            if "longitude" not in cols:
+                alter_stmts.append("ALTER TABLE users ADD COLUMN longitude FLOAT;")
 
             # Execute all ALTER statements
             for stmt in alter_stmts:
@@ -55,15 +67,98 @@ def ensure_user_columns():
             else:
                 print("All required columns already exist in users table")
 
+            # Reset tokens moved to password_reset_tokens (digest only); drop the
+            # legacy plaintext copies. Nothing writes these columns any more, so
+            # after the first run this matches no rows.
+            cleared = conn.execute(text(
+                "UPDATE users SET reset_token = NULL, reset_token_expires = NULL"
+                " WHERE reset_token IS NOT NULL OR reset_token_expires IS NOT NULL;"
+            )).rowcount
+            conn.commit()
+            if cleared:
+                print(f"Cleared legacy plaintext reset tokens from {cleared} users")
+
     except Exception as e:
         # Intentionally avoid raising to not block startup
         print(f"User columns migration skipped/failed: {e}")
 
 ensure_user_columns()
 
-app = FastAPI(title="EcoSort API", version="1.0.0")
+# Lightweight migration for SQLite: add badge rule columns if missing
+def ensure_badge_columns():
+    try:
+        with engine.connect() as conn:
+            res = conn.execute(text("PRAGMA table_info(badges);"))
+            cols = {row[1] for row in res}
+
+            alter_stmts = []
+            if "rule_type" not in cols:
+                alter_stmts.append("ALTER TABLE badges ADD COLUMN rule_type VARCHAR(20);")
+            if "rule_material" not in cols:
+                alter_stmts.append("ALTER TABLE badges ADD COLUMN rule_material VARCHAR(50);")
+            if "threshold" not in cols:
+                alter_stmts.append("ALTER TABLE badges ADD COLUMN threshold FLOAT;")
+
+            for stmt in alter_stmts:
+                print(f"Executing: {stmt}")
+                conn.execute(text(stmt))
+                conn.commit()
+    except Exception as e:
+        print(f"Badge columns migration skipped/failed: {e}")
+
+ensure_badge_columns()
+
+# Lightweight migration for SQLite: recycling center coordinates became nullable
+# (centers can be added by address and geocoded later). SQLite cannot drop NOT
+# NULL in place, so the table is copied into one with the current definition.
+def ensure_recycling_center_nullable_coords():
+    try:
+        with engine.connect() as conn:
+            res = conn.execute(text("PRAGMA table_info(recycling_centers);"))
+            notnull = {row[1]: row[3] for row in res}
+            if not (notnull.get("latitude") or notnull.get("longitude")):
+                return
+
+            print("Rebuilding recycling_centers to allow NULL coordinates...")
+            cols = ", ".join(c.name for c in RecyclingCenter.__table__.columns if c.name in notnull)
+            conn.execute(text("ALTER TABLE recycling_centers RENAME TO recycling_centers_old;"))
+            RecyclingCenter.__table__.create(bind=conn)
+            conn.execute(text(f"INSERT INTO recycling_centers ({cols}) SELECT {cols} FROM recycling_centers_old;"))
+            conn.execute(text("DROP TABLE recycling_centers_old;"))
+            conn.commit()
+            print("recycling_centers now accepts centers without coordinates")
+    except Exception as e:
+        print(f"Recycling center migration skipped/failed: {e}")
+
+ensure_recycling_center_nullable_coords()
+
+# Seed the default badge catalog used by the award engine
+def seed_badges():
+    db = SessionLocal()
+    try:
+        added = seed_default_badges(db)
+        if added:
+            print(f"Seeded {added} default badges")
+    except Exception as e:
+        print(f"Badge seeding skipped/failed: {e}")
+    finally:
+        db.close()
+
+seed_badges()
+
+# orjson renders the already-validated response models without jsonable_encoder
+app = FastAPI(title="EcoSort API", version="1.0.0", default_response_class=ORJSONResponse)
 
-# CORS middleware
+# Negotiated gzip/brotli for API bodies above COMPRESSION_MIN_SIZE
+app.add_middleware(CompressionMiddleware, paths=("/profile", "/recycle"))
+
+# Admission control: cap and shed /recycle/classify load so auth/profile stay fast
+app.add_middleware(AdmissionMiddleware, paths=("/recycle/classify",))
+
+# Carries the read-your-writes window between prefork workers via a header
+app.add_middleware(ReadYourWritesMiddleware)
+
+# CORS middleware (added last so it also wraps admission rejections)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=[
@@ -77,6 +172,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[READ_YOUR_WRITES_HEADER],
 )
 
 # Include routers
@@ -84,10 +180,39 @@ app.include_router(auth_router, prefix="/auth", tags=["Authentication"])
 app.include_router(profile_router, prefix="/profile", tags=["Profile"])
 app.include_router(recycle_router, prefix="/recycle", tags=["Recycling Centers"])
 app.include_router(classify_router, prefix="/recycle", tags=["Classification"])
+app.include_router(classify_stream_router, prefix="/recycle", tags=["Classification"])
+
+# Background loops. asyncio only keeps weak references to tasks, so hold them
+# here until shutdown cancels them.
+app.state.background_tasks = set()
+
+def start_background_task(coro):
+    app.state.background_tasks.add(asyncio.create_task(coro))
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    tasks = app.state.background_tasks
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    tasks.clear()
+
+# Periodically purge expired password reset tokens
+@app.on_event("startup")
+async def start_reset_token_sweeper():
+    start_background_task(reset_token_sweeper())
+
+# Geocode new and changed addresses off the request path (one worker per host)
+@app.on_event("startup")
+async def start_geocode_backfill():
+    if GEOCODE_BACKFILL_SECONDS > 0:
+        start_background_task(geocode_backfill_loop())
 
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
 
+# Single process with reload for development; for several workers sharing one
+# copy of the classifier use `python prefork.py --workers N`
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
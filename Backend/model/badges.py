@@ -0,0 +1,331 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import event, func, inspect
+from sqlalchemy.exc import IntegrityError
+from model.connect import SessionLocal, use_primary
+from model.model import Scan, ScanRollupDaily, ImpactDaily, Badge, UserBadge, UserStats, UserMaterialStats
+
+from datetime import date, timedelta
+
+# -------- Badge award engine ----------
+# Badge rules live in the `badges` table (rule_type / rule_material / threshold).
+# Each scan event updates the user's running counters and only evaluates the
+# rules whose metric actually moved; awards are written to `user_badges` once.
+# Writers only insert Scan / ImpactDaily rows: the session listeners at the
+# bottom apply them to the counters in the same transaction.
+
+RULE_SCANS = "scans"
+RULE_MATERIAL = "material"
+RULE_STREAK = "streak"
+RULE_CO2 = "co2"
+
+# Default catalog, seeded on startup if the codes are missing
+DEFAULT_BADGES = [
+    {"code": "FIRST_SCAN", "name": "First Scan", "description": "Scan your first item",
+     "rule_type": RULE_SCANS, "threshold": 1},
+    {"code": "STREAK_MASTER", "name": "Streak Master", "description": "Scan items 7 days in a row",
+     "rule_type": RULE_STREAK, "threshold": 7},
+    {"code": "PLASTIC_PRO", "name": "Plastic Pro", "description": "Scan 50 items",
+     "rule_type": RULE_SCANS, "threshold": 50},
+    {"code": "GLASS_GUARDIAN", "name": "Glass Guardian", "description": "Scan 100 items",
+     "rule_type": RULE_SCANS, "threshold": 100},
+    {"code": "METAL_MASTER", "name": "Metal Master", "description": "Scan 150 items",
+     "rule_type": RULE_SCANS, "threshold": 150},
+    {"code": "EWASTE_EXPERT", "name": "E-waste Expert", "description": "Scan 200 items",
+     "rule_type": RULE_SCANS, "threshold": 200},
+    {"code": "ECO_HERO", "name": "Eco Hero", "description": "Save 20kg of CO₂",
+     "rule_type": RULE_CO2, "threshold": 20000},
+]
+
+def seed_default_badges(db: Session):
+    """Insert any default badge that is not in the catalog yet"""
+    existing = {code for (code,) in db.query(Badge.code).all()}
+    added = 0
+    for spec in DEFAULT_BADGES:
+        if spec["code"] not in existing:
+            db.add(Badge(**spec))
+            added += 1
+    if added:
+        db.commit()
+    return added
+
+def normalize_material(material: str | None) -> str | None:
+    return material.strip().lower() if material else None
+
+def compute_streak(days, today: date) -> int:
+    """Consecutive days with scans ending today (0 if nothing scanned today)"""
+    streak = 0
+    check_date = today
+    for d in sorted(set(days), reverse=True):
+        if d == check_date:
+            streak += 1
+            check_date -= timedelta(days=1)
+        elif d > check_date:
+            continue
+        else:
+            break
+    return streak
+
+def current_streak(stats: UserStats, today: date | None = None) -> int:
+    """Streak as displayed: it only counts while the user has scanned today"""
+    today = today or date.today()
+    if stats.last_scan_day == today:
+        return stats.streak_days
+    return 0
+
+def rebuild_user_stats(db: Session, user_id: int) -> UserStats:
+    """Recompute a user's counters from the hot scans plus their compacted rollups (backfill / repair)"""
+    # Everything flushed so far is counted below, so its pending events are moot
+    db.flush()
+    _discard_events(db, user_id)
+
+    total_scans = db.query(Scan).filter(Scan.user_id == user_id).count()
+    total_scans += db.query(func.coalesce(func.sum(ScanRollupDaily.scans), 0)).filter(
+        ScanRollupDaily.user_id == user_id
+    ).scalar()
+    co2_result = db.query(func.sum(ImpactDaily.co2_saved_g)).filter(ImpactDaily.user_id == user_id).scalar()
+
+    scan_dates = {d[0].date() for d in db.query(Scan.created_at).filter(Scan.user_id == user_id).all() if d[0]}
+    scan_dates.update(d[0] for d in db.query(ScanRollupDaily.day).filter(ScanRollupDaily.user_id == user_id).distinct())
+    last_scan_day = max(scan_dates) if scan_dates else None
+    streak = compute_streak(scan_dates, last_scan_day) if last_scan_day else 0
+
+    stats = db.get(UserStats, user_id)
+    if stats is None:
+        stats = UserStats(user_id=user_id)
+        db.add(stats)
+    stats.total_scans = total_scans
+    stats.co2_saved_g = co2_result or 0.0
+    stats.streak_days = streak
+    stats.last_scan_day = last_scan_day
+    stats.version = (stats.version or 0) + 1
+
+    material_counts = {}
+    hot = db.query(Scan.predicted_material, func.count(Scan.id)).filter(
+        Scan.user_id == user_id, Scan.predicted_material.isnot(None)
+    ).group_by(Scan.predicted_material).all()
+    rolled = db.query(ScanRollupDaily.material, func.sum(ScanRollupDaily.scans)).filter(
+        ScanRollupDaily.user_id == user_id, ScanRollupDaily.material.isnot(None)
+    ).group_by(ScanRollupDaily.material).all()
+    for material, count in hot + rolled:
+        key = normalize_material(material)
+        if key:
+            material_counts[key] = material_counts.get(key, 0) + count
+
+    db.query(UserMaterialStats).filter(UserMaterialStats.user_id == user_id).delete()
+    for material, count in material_counts.items():
+        db.add(UserMaterialStats(user_id=user_id, material=material, scans=count))
+
+    db.flush()
+    return stats
+
+def build_user_stats(db: Session, user_id: int) -> UserStats | None:
+    """
+    Build a user's counters and badges from history inside a savepoint.
+    Returns None (and leaves the session usable) if a concurrent request
+    inserted them first.
+    """
+    try:
+        with db.begin_nested():
+            stats = rebuild_user_stats(db, user_id)
+            evaluate_badges(db, user_id, stats)
+        return stats
+    except IntegrityError:
+        return None
+
+def get_user_stats(db: Session, user_id: int) -> UserStats:
+    """Return the user's counters, building them (and their badges) on first use"""
+    stats = db.get(UserStats, user_id)
+    if stats is None and db.info.get("use_replica"):
+        # A replica may lag behind; only build counters the primary lacks
+        use_primary(db)
+        stats = db.get(UserStats, user_id)
+    if stats is None:
+        stats = build_user_stats(db, user_id)
+        db.commit()
+        if stats is None:
+            # Lost the race to another first read: use the row it committed
+            stats = db.get(UserStats, user_id)
+    return stats
+
+def _material_count(db: Session, user_id: int, material: str) -> int:
+    row = db.query(UserMaterialStats.scans).filter(
+        UserMaterialStats.user_id == user_id,
+        UserMaterialStats.material == material
+    ).first()
+    return row[0] if row else 0
+
+def evaluate_badges(db: Session, user_id: int, stats: UserStats, rule_types=None, material: str | None = None):
+    """
+    Award every not-yet-held badge whose rule is satisfied.
+    `rule_types` / `material` restrict evaluation to the rules a scan event touched.
+    """
+    held = db.query(UserBadge.badge_id).filter(UserBadge.user_id == user_id)
+    query = db.query(Badge).filter(Badge.rule_type.isnot(None), Badge.id.notin_(held))
+    if rule_types is not None:
+        query = query.filter(Badge.rule_type.in_(list(rule_types)))
+    if material is not None:
+        # rule_material is free text in the catalog; normalize it like material is
+        query = query.filter(
+            (Badge.rule_type != RULE_MATERIAL) | (func.lower(func.trim(Badge.rule_material)) == material)
+        )
+
+    awarded = []
+    material_counts = {}
+    for badge in query.all():
+        threshold = badge.threshold or 0
+        if badge.rule_type == RULE_SCANS:
+            value = stats.total_scans
+            reason = f"{stats.total_scans} items scanned"
+        elif badge.rule_type == RULE_STREAK:
+            value = stats.streak_days
+            reason = f"{stats.streak_days}-day scan streak"
+        elif badge.rule_type == RULE_CO2:
+            value = stats.co2_saved_g
+            reason = f"{round(stats.co2_saved_g / 1000, 2)}kg CO₂ saved"
+        elif badge.rule_type == RULE_MATERIAL:
+            key = normalize_material(badge.rule_material)
+            if key not in material_counts:
+                material_counts[key] = _material_count(db, user_id, key)
+            value = material_counts[key]
+            reason = f"{value} {key} items scanned"
+        else:
+            continue
+
+        if value >= threshold:
+            db.add(UserBadge(user_id=user_id, badge_id=badge.id, reason=reason))
+            awarded.append(badge)
+
+    if awarded:
+        db.flush()
+    return awarded
+
+def on_scan(db: Session, scan: Scan, co2_saved_g: float = 0.0):
+    """
+    Apply a newly stored scan to the user's counters and award badges.
+    Called for every new Scan by the commit listener below, so writers should
+    not call it themselves. Returns the list of newly awarded badges.
+    """
+    if scan.user_id is None:
+        return []
+
+    existed = db.get(UserStats, scan.user_id) is not None
+    if not existed:
+        # First event for this user: build counters from history (includes this scan)
+        db.flush()
+        stats = rebuild_user_stats(db, scan.user_id)
+        return evaluate_badges(db, scan.user_id, stats)
+
+    stats = db.get(UserStats, scan.user_id)
+    scan_day = scan.created_at.date() if scan.created_at else date.today()
+
+    touched = {RULE_SCANS}
+    stats.total_scans += 1
+    stats.version = (stats.version or 0) + 1
+
+    if co2_saved_g:
+        stats.co2_saved_g += co2_saved_g
+        touched.add(RULE_CO2)
+
+    if stats.last_scan_day is None or scan_day > stats.last_scan_day:
+        if stats.last_scan_day == scan_day - timedelta(days=1):
+            stats.streak_days += 1
+        else:
+            stats.streak_days = 1
+        stats.last_scan_day = scan_day
+        touched.add(RULE_STREAK)
+
+    material = normalize_material(scan.predicted_material)
+    if material:
+        row = db.query(UserMaterialStats).filter(
+            UserMaterialStats.user_id == scan.user_id,
+            UserMaterialStats.material == material
+        ).first()
+        if row is None:
+            db.add(UserMaterialStats(user_id=scan.user_id, material=material, scans=1))
+        else:
+            row.scans += 1
+        touched.add(RULE_MATERIAL)
+
+    db.flush()
+    return evaluate_badges(db, scan.user_id, stats, rule_types=touched, material=material)
+
+def on_co2_saved(db: Session, user_id: int, co2_saved_g: float):
+    """Apply an ImpactDaily CO₂ change to the user's counters and award CO₂ badges"""
+    stats = db.get(UserStats, user_id)
+    if stats is None:
+        stats = rebuild_user_stats(db, user_id)
+        return evaluate_badges(db, user_id, stats)
+
+    stats.co2_saved_g = (stats.co2_saved_g or 0.0) + co2_saved_g
+    stats.version = (stats.version or 0) + 1
+    db.flush()
+    return evaluate_badges(db, user_id, stats, rule_types={RULE_CO2})
+
+# -------- Keeping counters current ----------
+# after_flush records new scans and ImpactDaily CO₂ changes; before_commit
+# applies them, so counters, badges and the stats ETag version commit (or roll
+# back) together with the rows that moved them.
+
+_EVENTS_KEY = "stat_events"
+
+def _pending_events(session) -> dict:
+    return session.info.setdefault(_EVENTS_KEY, {"scans": [], "co2": {}})
+
+def _discard_events(session, user_id: int):
+    events = session.info.get(_EVENTS_KEY)
+    if events:
+        events["scans"] = [scan for scan in events["scans"] if scan.user_id != user_id]
+        events["co2"].pop(user_id, None)
+
+def apply_stat_events(db: Session, scans, co2_by_user: dict):
+    """Apply new scans and CO₂ deltas; users without counters get them built from history"""
+    user_ids = {scan.user_id for scan in scans} | set(co2_by_user)
+    user_ids.discard(None)
+
+    built = set()
+    for user_id in user_ids:
+        # A build counts everything flushed so far, this transaction's events included
+        if db.get(UserStats, user_id) is None and build_user_stats(db, user_id) is not None:
+            built.add(user_id)
+
+    awarded = []
+    for scan in scans:
+        if scan.user_id is not None and scan.user_id not in built:
+            awarded += on_scan(db, scan)
+    for user_id, delta in co2_by_user.items():
+        if user_id is not None and user_id not in built and delta:
+            awarded += on_co2_saved(db, user_id, delta)
+    return awarded
+
+@event.listens_for(SessionLocal, "after_flush")
+def _record_stat_events(session, flush_context):
+    for obj in session.new:
+        if isinstance(obj, Scan):
+            _pending_events(session)["scans"].append(obj)
+        elif isinstance(obj, ImpactDaily) and obj.co2_saved_g:
+            co2 = _pending_events(session)["co2"]
+            co2[obj.user_id] = co2.get(obj.user_id, 0.0) + obj.co2_saved_g
+    for obj in session.dirty:
+        if isinstance(obj, ImpactDaily):
+            history = inspect(obj).attrs.co2_saved_g.history
+            if history.added:
+                old = history.deleted[0] if history.deleted else 0.0
+                co2 = _pending_events(session)["co2"]
+                co2[obj.user_id] = co2.get(obj.user_id, 0.0) + (history.added[0] or 0.0) - (old or 0.0)
+
+@event.listens_for(SessionLocal, "before_commit")
+def _apply_stat_events(session):
+    if session.in_nested_transaction():
+        return  # savepoint release; the outer commit applies the events
+    session.flush()
+    events = session.info.pop(_EVENTS_KEY, None)
+    if events:
+        # Scans from a rolled-back savepoint are transient again
+        scans = [scan for scan in events["scans"] if inspect(scan).persistent]
+        if scans or events["co2"]:
+            apply_stat_events(session, scans, events["co2"])
+
+@event.listens_for(SessionLocal, "after_soft_rollback")
+def _drop_stat_events(session, previous_transaction):
+    if previous_transaction.parent is None:
+        session.info.pop(_EVENTS_KEY, None)
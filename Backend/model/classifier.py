@@ -0,0 +1,86 @@
+from dotenv import load_dotenv
+import os
+import threading
+
+load_dotenv()
+
+# -------- Classifier weights ----------
+# One process-wide model instance. The weights are memory-mapped from disk, so
+# their pages live in the OS page cache and are shared between every process
+# that maps the same file. When the prefork launcher loads the model before
+# forking, the Python objects around them are shared copy-on-write as well.
+
+MODEL_PATH = os.getenv("MODEL_PATH", os.path.join(os.path.dirname(__file__), "weights", "classifier.pt"))
+
+_classifier = None
+_lock = threading.Lock()
+
+def _load(path: str):
+    import torch
+
+    # mmap=True keeps tensor storages file-backed instead of copying them to the heap
+    obj = torch.load(path, map_location="cpu", mmap=True, weights_only=False)
+
+    # Training checkpoints (e.g. ultralytics) wrap the module in a dict
+    if isinstance(obj, dict):
+        obj = obj.get("ema") or obj.get("model")
+    if not isinstance(obj, torch.nn.Module):
+        raise ValueError(f"{path} does not contain a serialized model (state_dicts need their architecture)")
+
+    # Casting (.float()/.half()) would copy every tensor; save weights in the inference dtype instead
+    obj.eval()
+    for param in obj.parameters():
+        param.requires_grad_(False)
+    return obj
+
+def load_classifier(path: str | None = None):
+    """Load the classifier once per process (no-op if already loaded)"""
+    global _classifier
+    if _classifier is None:
+        with _lock:
+            if _classifier is None:
+                _classifier = _load(path or MODEL_PATH)
+                print(f"Classifier loaded from {path or MODEL_PATH}")
+    return _classifier
+
+def get_classifier():
+    """Model instance for the classify routes"""
+    return load_classifier()
+
+def is_loaded() -> bool:
+    return _classifier is not None
+
+def class_names(model) -> list[str]:
+    """Label per output index: the model's own `names` (ultralytics) or MODEL_CLASS_NAMES"""
+    names = getattr(model, "names", None)
+    if isinstance(names, dict):
+        return [names[i] for i in sorted(names)]
+    if names:
+        return list(names)
+    return [n.strip() for n in os.getenv("MODEL_CLASS_NAMES", "").split(",") if n.strip()]
+
+def _param_dtype(model):
+    param = next(model.parameters(), None)
+    return param.dtype if param is not None else None
+
+def predict_probs(model, x):
+    """
+    Class probabilities for one preprocessed (3, H, W) float32 array.
+    Ultralytics heads already return softmax output in eval mode; raw logits
+    from other models are softmaxed here. The input is cast to the weights'
+    dtype (ultralytics checkpoints are saved in fp16).
+    """
+    import torch
+
+    with torch.inference_mode():
+        inputs = torch.from_numpy(x)[None]
+        dtype = _param_dtype(model)
+        if dtype is not None and inputs.dtype != dtype:
+            inputs = inputs.to(dtype)  # one small copy per frame, instead of casting the weights
+        out = model(inputs)
+        if isinstance(out, (tuple, list)):
+            out = out[0]
+        out = out[0].float()
+        if out.min() < 0 or abs(float(out.sum()) - 1.0) > 1e-3:
+            out = out.softmax(0)
+    return out.numpy()
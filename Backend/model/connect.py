@@ -1,16 +1,201 @@
-from sqlalchemy import create_engine, MetaData
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import create_engine, event, text, Insert, Update, Delete
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session, sessionmaker
 from dotenv import load_dotenv
+from contextvars import ContextVar
+import itertools
 import os
+import threading
+import time
 
 load_dotenv()
 
 # -------- Connect to the Database ----------
 
 DATABASE_URL = os.getenv("DATABASE_URL")
+# Optional comma-separated read replicas, e.g. "postgresql://replica1/ecosort,postgresql://replica2/ecosort".
+# A replica must carry the primary's schema and data (streaming replication on
+# PostgreSQL). To try routing locally with SQLite, snapshot the primary after
+# startup has run its migrations and point the replica at the copy:
+#   sqlite3 ecosort.db ".backup replica.db"
+#   DATABASE_REPLICA_URLS=sqlite:///replica.db
+# A replica that errors on a read is taken out of rotation and the read retried
+# on the primary, so a stale or empty copy degrades to primary-only reads.
+DATABASE_REPLICA_URLS = [u.strip() for u in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if u.strip()]
+# How long a user's reads stay on the primary after they wrote (replication lag allowance)
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+REPLICA_RETRY_SECONDS = float(os.getenv("REPLICA_RETRY_SECONDS", "30"))
+REPLICA_HEALTH_CHECK_SECONDS = float(os.getenv("REPLICA_HEALTH_CHECK_SECONDS", "10"))
 
 engine = create_engine(DATABASE_URL, echo=False, future=True)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# -------- Read replicas ----------
+
+class ReplicaPool:
+    """Round-robin over replica engines, skipping ones that failed their health check"""
+
+    def __init__(self, urls):
+        self.engines = [create_engine(url, echo=False, future=True, pool_pre_ping=True) for url in urls]
+        self._checked_at = {}  # engine -> monotonic time of last successful probe
+        self._down_until = {}  # engine -> monotonic time of next probe after a failure
+        self._cycle = itertools.cycle(self.engines) if self.engines else None
+        self._lock = threading.Lock()
+        for replica in self.engines:
+            event.listen(replica, "handle_error", self._on_error)
+
+    def _on_error(self, context):
+        # Any replica error (connect failure, dropped connection, missing or
+        # outdated schema) takes it out of rotation; RoutingSession retries
+        # the read on the primary
+        if context.engine is not None:
+            self.mark_down(context.engine)
+
+    def is_down(self, replica) -> bool:
+        with self._lock:
+            return self._down_until.get(replica, 0) > time.monotonic()
+
+    def mark_down(self, replica):
+        with self._lock:
+            was_down = self._down_until.get(replica, 0) > time.monotonic()
+            self._down_until[replica] = time.monotonic() + REPLICA_RETRY_SECONDS
+            self._checked_at.pop(replica, None)
+        if not was_down:
+            print(f"Read replica {replica.url.render_as_string(hide_password=True)} marked down")
+
+    def _healthy(self, replica) -> bool:
+        """Probe with SELECT 1 at most every REPLICA_HEALTH_CHECK_SECONDS (per process)"""
+        now = time.monotonic()
+        with self._lock:
+            down_until = self._down_until.get(replica)
+            checked_at = self._checked_at.get(replica)
+        if down_until is not None and now < down_until:
+            return False
+        if checked_at is not None and now - checked_at < REPLICA_HEALTH_CHECK_SECONDS:
+            return True
+        try:
+            with replica.connect() as conn:
+                conn.execute(text("SELECT 1"))
+        except Exception:
+            self.mark_down(replica)
+            return False
+        with self._lock:
+            self._down_until.pop(replica, None)
+            self._checked_at[replica] = now
+        return True
+
+    def pick(self):
+        """Next healthy replica, or None (callers fall back to the primary)"""
+        if not self.engines:
+            return None
+        for _ in range(len(self.engines)):
+            with self._lock:
+                replica = next(self._cycle)
+            if self._healthy(replica):
+                return replica
+        return None
+
+replicas = ReplicaPool(DATABASE_REPLICA_URLS)
+
+# -------- Read-your-writes ----------
+# Two sources, either of which keeps reads on the primary:
+#   * per process: users who committed a write within READ_YOUR_WRITES_SECONDS
+#   * per client: a wall-clock deadline the client echoes back in the
+#     X-Read-Your-Writes-Until header (routing/consistency.py). This is what
+#     carries the window across prefork workers, where the per-process map
+#     only sees writes made by the same worker.
+
+_recent_writers = {}  # user_id -> monotonic time until which reads stay on the primary
+_recent_lock = threading.Lock()
+
+class WriteWindow:
+    """The current request's read-your-writes deadline (time.time()); recorded=True once it wrote"""
+    __slots__ = ("until", "recorded")
+
+    def __init__(self, until: float = 0.0):
+        self.until = until
+        self.recorded = False
+
+current_write_window: ContextVar[WriteWindow | None] = ContextVar("current_write_window", default=None)
+
+def wrote_recently(user_id) -> bool:
+    window = current_write_window.get()
+    if window is not None and window.until > time.time():
+        return True
+    if user_id is None:
+        return False
+    with _recent_lock:
+        until = _recent_writers.get(user_id)
+        if until is None:
+            return False
+        if until < time.monotonic():
+            del _recent_writers[user_id]
+            return False
+        return True
+
+def _record_write(user_id):
+    if user_id is not None:
+        with _recent_lock:
+            _recent_writers[user_id] = time.monotonic() + READ_YOUR_WRITES_SECONDS
+    window = current_write_window.get()
+    if window is not None:
+        window.until = time.time() + READ_YOUR_WRITES_SECONDS
+        window.recorded = True
+
+class RoutingSession(Session):
+    """
+    Statements go to the primary unless the session opted in with use_replica().
+    Even then, flushes and INSERT/UPDATE/DELETE use the primary, and so does
+    every read after the session wrote or within READ_YOUR_WRITES_SECONDS of
+    the same user's last write (session.info["user_id"]).
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if self._flushing or isinstance(clause, (Insert, Update, Delete)):
+            self.info["wrote"] = True
+            return engine
+        if not self.info.get("use_replica") or self.info.get("wrote") or wrote_recently(self.info.get("user_id")):
+            return engine
+        replica = self.info.get("replica")
+        if replica is None:
+            # One replica per session keeps its reads consistent with each other
+            replica = self.info["replica"] = replicas.pick() or engine
+        return replica
+
+    def execute(self, statement, *args, **kw):
+        try:
+            return super().execute(statement, *args, **kw)
+        except DBAPIError:
+            replica = self.info.get("replica")
+            retry = (
+                replica is not None and replica is not engine and replicas.is_down(replica)
+                and not self.info.get("wrote") and not (self.new or self.dirty or self.deleted)
+            )
+            if not retry:
+                raise
+            # The replica failed this read (and was marked down): redo it on the primary
+            self.rollback()
+            self.info["replica"] = engine
+            return super().execute(statement, *args, **kw)
+
+@event.listens_for(RoutingSession, "after_commit")
+def _after_commit(session):
+    if session.info.pop("wrote", False):
+        _record_write(session.info.get("user_id"))
+
+SessionLocal = sessionmaker(class_=RoutingSession, autocommit=False, autoflush=False, bind=engine)
+
+def use_replica(db: Session, user_id: int | None = None) -> Session:
+    """Let this session's reads go to a replica (no-op without DATABASE_REPLICA_URLS)"""
+    if user_id is not None:
+        db.info["user_id"] = user_id
+    db.info["use_replica"] = True
+    return db
+
+def use_primary(db: Session) -> Session:
+    """Send the rest of this session's reads to the primary"""
+    db.info["use_replica"] = False
+    db.info.pop("replica", None)
+    return db
 
 def connect_DB():
     # Create engine and session
@@ -0,0 +1,398 @@
+"""
+Geocoding: free-text addresses (users, recycling centers) to coordinates.
+
+Lookups go through a persistent on-disk cache keyed by the normalized
+address, so each distinct address reaches the provider once. Concurrent
+lookups of the same address share one provider call. Coordinates are
+backfilled onto users and recycling_centers in batches (background loop or
+CLI), and proximity queries only read stored coordinates, never geocode.
+
+Providers, chosen by GEOCODER_PROVIDER:
+    google     Google Maps Geocoding API (GOOGLE_MAPS_API_KEY)
+    gazetteer  local CSV file (GEOCODER_GAZETTEER_PATH) with columns
+               address,latitude,longitude, for offline use
+    none       cache only
+
+The background backfill runs in one process per host: prefork workers compete
+for a file lock next to the cache, and the others skip their ticks.
+
+Backfill manually, from the Backend directory:
+    python -m model.geocoding --batch-size 100
+"""
+from sqlalchemy.orm import Session
+from model.model import User, RecyclingCenter
+from dotenv import load_dotenv
+
+from concurrent.futures import Future
+import argparse
+import asyncio
+import csv
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, every process backfills
+    fcntl = None
+
+load_dotenv()
+
+GEOCODER_PROVIDER = os.getenv("GEOCODER_PROVIDER", "").lower()
+GOOGLE_MAPS_API_KEY = os.getenv("GOOGLE_MAPS_API_KEY")
+GEOCODER_GAZETTEER_PATH = os.getenv("GEOCODER_GAZETTEER_PATH")
+GEOCODE_CACHE_PATH = os.getenv(
+    "GEOCODE_CACHE_PATH", os.path.join(os.path.dirname(os.path.dirname(__file__)), "cache", "geocode.sqlite3")
+)
+# Addresses the provider could not resolve are retried after this long
+GEOCODE_NEGATIVE_TTL_DAYS = float(os.getenv("GEOCODE_NEGATIVE_TTL_DAYS", "7"))
+GEOCODE_BACKFILL_SECONDS = int(os.getenv("GEOCODE_BACKFILL_SECONDS", "300"))  # 0 disables the loop
+GEOCODE_BACKFILL_LOCK_PATH = os.getenv("GEOCODE_BACKFILL_LOCK_PATH", GEOCODE_CACHE_PATH + ".backfill.lock")
+BATCH_SIZE = 100
+
+class GeocodingError(Exception):
+    """Transient provider failure (network, quota); the result is not cached"""
+
+def normalize_address(address: str | None) -> str | None:
+    """Cache key: lowercase, single spaces, no stray punctuation ("12 Main St." == "12 main st")"""
+    if not address:
+        return None
+    key = address.lower().replace("\n", ",")
+    key = re.sub(r"[^\w\s,#/-]", "", key)
+    key = re.sub(r"\s*,\s*", ", ", key)
+    key = re.sub(r"\s+", " ", key).strip(" ,")
+    return key or None
+
+# -------- Providers ----------
+
+class GoogleMapsProvider:
+    name = "google"
+
+    def __init__(self, api_key: str):
+        import googlemaps
+
+        self._client = googlemaps.Client(key=api_key, timeout=10)
+        self._errors = (googlemaps.exceptions.ApiError, googlemaps.exceptions.TransportError,
+                        googlemaps.exceptions.Timeout)
+
+    def geocode(self, address: str):
+        try:
+            results = self._client.geocode(address)
+        except self._errors as e:
+            raise GeocodingError(str(e)) from e
+        if not results:
+            return None
+        location = results[0]["geometry"]["location"]
+        return location["lat"], location["lng"]
+
+class GazetteerProvider:
+    """
+    Offline lookups from a CSV of known places. Unknown street addresses fall
+    back to the longest known suffix ("12 main st, springfield, il" ->
+    "springfield, il"), i.e. the town centroid.
+    """
+    name = "gazetteer"
+
+    def __init__(self, path: str):
+        self.places = {}
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                key = normalize_address(row.get("address"))
+                if key:
+                    self.places[key] = (float(row["latitude"]), float(row["longitude"]))
+        print(f"Gazetteer loaded {len(self.places)} places from {path}")
+
+    def geocode(self, address: str):
+        parts = normalize_address(address).split(", ")
+        for i in range(len(parts)):
+            found = self.places.get(", ".join(parts[i:]))
+            if found:
+                return found
+        return None
+
+def make_provider(name: str | None = GEOCODER_PROVIDER):
+    """Provider from GEOCODER_PROVIDER, or whichever one is configured"""
+    if not name:
+        name = "google" if GOOGLE_MAPS_API_KEY else "gazetteer" if GEOCODER_GAZETTEER_PATH else "none"
+    if name == "google":
+        if not GOOGLE_MAPS_API_KEY:
+            raise ValueError("GEOCODER_PROVIDER=google needs GOOGLE_MAPS_API_KEY")
+        return GoogleMapsProvider(GOOGLE_MAPS_API_KEY)
+    if name == "gazetteer":
+        if not GEOCODER_GAZETTEER_PATH:
+            raise ValueError("GEOCODER_PROVIDER=gazetteer needs GEOCODER_GAZETTEER_PATH")
+        return GazetteerProvider(GEOCODER_GAZETTEER_PATH)
+    if name == "none":
+        return None
+    raise ValueError(f"Unknown GEOCODER_PROVIDER: {name}")
+
+# -------- Cache ----------
+
+_MISS = object()
+
+class GeocodeCache:
+    """
+    normalized address -> (lat, lon), or None for addresses the provider
+    could not resolve. SQLite in WAL mode, so prefork workers share one file.
+    """
+
+    def __init__(self, path: str = GEOCODE_CACHE_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS geocode_cache ("
+                " address TEXT PRIMARY KEY, latitude REAL, longitude REAL,"
+                " provider TEXT, looked_up_at REAL NOT NULL)"
+            )
+
+    def get(self, key: str):
+        """(lat, lon), None for a fresh negative entry, or _MISS"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT latitude, longitude, looked_up_at FROM geocode_cache WHERE address = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return _MISS
+        lat, lon, looked_up_at = row
+        if lat is None:
+            if time.time() - looked_up_at > GEOCODE_NEGATIVE_TTL_DAYS * 86400:
+                return _MISS
+            return None
+        return lat, lon
+
+    def put(self, key: str, coords, provider: str | None = None):
+        lat, lon = coords if coords else (None, None)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO geocode_cache (address, latitude, longitude, provider, looked_up_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (key, lat, lon, provider, time.time()),
+            )
+
+# -------- Geocoder ----------
+
+class Geocoder:
+    """Cache in front of a provider, with in-flight lookups coalesced per address"""
+
+    def __init__(self, provider=None, cache: GeocodeCache | None = None):
+        self.provider = provider
+        self.cache = cache or get_geocode_cache()
+        self._inflight = {}  # normalized address -> Future
+        self._lock = threading.Lock()
+
+    def cached(self, address: str | None):
+        """Coordinates if already known; never calls the provider"""
+        key = normalize_address(address)
+        if key is None:
+            return None
+        found = self.cache.get(key)
+        return None if found is _MISS else found
+
+    def geocode(self, address: str | None):
+        """(lat, lon) or None. Blocks on the provider on a cache miss; raises GeocodingError"""
+        key = normalize_address(address)
+        if key is None:
+            return None
+        found = self.cache.get(key)
+        if found is not _MISS:
+            return found
+        if self.provider is None:
+            return None
+
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+        if not owner:
+            return future.result()  # same address already being looked up
+
+        try:
+            coords = self.provider.geocode(address)
+            self.cache.put(key, coords, self.provider.name)
+            future.set_result(coords)
+            return coords
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+_cache = None
+_geocoder = None
+_geocoder_lock = threading.Lock()
+
+def get_geocode_cache() -> GeocodeCache:
+    """Process-wide cache; opening it needs no provider configuration"""
+    global _cache
+    if _cache is None:
+        with _geocoder_lock:
+            if _cache is None:
+                _cache = GeocodeCache()
+    return _cache
+
+def cached_coordinates(address: str | None):
+    """
+    Coordinates already in the cache, else None. For request paths: never
+    calls a provider and never raises, so a misconfigured geocoder or an
+    unwritable cache directory cannot fail the request.
+    """
+    key = normalize_address(address)
+    if key is None:
+        return None
+    try:
+        found = get_geocode_cache().get(key)
+    except Exception as e:
+        print(f"Geocode cache unavailable: {e}")
+        return None
+    return None if found is _MISS else found
+
+def get_geocoder() -> Geocoder:
+    """Process-wide geocoder configured from the environment"""
+    global _geocoder
+    if _geocoder is None:
+        with _geocoder_lock:
+            if _geocoder is None:
+                _geocoder = Geocoder(make_provider())
+    return _geocoder
+
+# -------- Backfill ----------
+
+def _backfill(db: Session, model, geocoder: Geocoder, batch_size: int) -> tuple[int, int]:
+    """Geocode rows of `model` with an address and no coordinates; returns (resolved, unresolved)"""
+    resolved = unresolved = 0
+    last_id = 0
+    while True:
+        # Keyset pagination: rows that stay unresolved are not fetched again
+        batch = db.query(model).filter(
+            model.id > last_id,
+            model.address.isnot(None),
+            model.latitude.is_(None),
+        ).order_by(model.id).limit(batch_size).all()
+        if not batch:
+            break
+
+        for row in batch:
+            try:
+                coords = geocoder.geocode(row.address)
+            except GeocodingError as e:
+                print(f"Geocoding stopped, provider unavailable: {e}")
+                db.commit()
+                return resolved, unresolved
+            if coords:
+                row.latitude, row.longitude = coords
+                resolved += 1
+            else:
+                unresolved += 1
+        last_id = batch[-1].id
+        db.commit()
+        db.expunge_all()
+
+        if len(batch) < batch_size:
+            break
+    return resolved, unresolved
+
+def backfill_coordinates(db: Session, geocoder: Geocoder | None = None, batch_size: int = BATCH_SIZE) -> dict:
+    """Fill in missing coordinates for users and recycling centers"""
+    geocoder = geocoder or get_geocoder()
+    return {
+        "users": _backfill(db, User, geocoder, batch_size),
+        "recycling_centers": _backfill(db, RecyclingCenter, geocoder, batch_size),
+    }
+
+def take_backfill_lock(path: str = GEOCODE_BACKFILL_LOCK_PATH):
+    """
+    Non-blocking exclusive lock, held until the process exits (then another
+    worker picks it up). Returns the open lock file, or None if another
+    process already holds it.
+    """
+    if fcntl is None:
+        return True
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    lock_file = open(path, "a")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return None
+    return lock_file
+
+async def geocode_backfill_loop(interval: int = GEOCODE_BACKFILL_SECONDS):
+    """Background loop geocoding new or changed addresses every `interval` seconds"""
+    from model.connect import SessionLocal
+
+    lock = None
+    while True:
+        await asyncio.sleep(interval)
+        if lock is None:
+            try:
+                lock = take_backfill_lock()
+            except OSError as e:
+                print(f"Geocoding backfill lock unavailable: {e}")
+            if lock is None:
+                continue  # another worker on this host is backfilling
+        db = SessionLocal()
+        try:
+            counts = await asyncio.to_thread(backfill_coordinates, db)
+            resolved = sum(done for done, _ in counts.values())
+            if resolved:
+                print(f"Geocoded {resolved} addresses")
+        except Exception as e:
+            print(f"Geocoding backfill failed: {e}")
+        finally:
+            db.close()
+
+# -------- Proximity ----------
+
+EARTH_RADIUS_KM = 6371.0
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+def nearby_centers(db: Session, lat: float, lon: float, radius_km: float = 10, limit: int = 20):
+    """Centers within `radius_km`, nearest first, as (center, distance_km)"""
+    # Bounding box in SQL first, exact distance only for the candidates
+    dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    dlon = math.degrees(radius_km / (EARTH_RADIUS_KM * max(math.cos(math.radians(lat)), 1e-6)))
+    candidates = db.query(RecyclingCenter).filter(
+        RecyclingCenter.latitude.between(lat - dlat, lat + dlat),
+        RecyclingCenter.longitude.between(lon - dlon, lon + dlon),
+    ).all()
+
+    found = []
+    for center in candidates:
+        distance = haversine_km(lat, lon, center.latitude, center.longitude)
+        if distance <= radius_km:
+            found.append((center, distance))
+    found.sort(key=lambda item: item[1])
+    return found[:limit]
+
+def main(argv=None):
+    from model.connect import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Backfill coordinates for user and recycling center addresses")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--provider", default=GEOCODER_PROVIDER, help="google, gazetteer or none")
+    args = parser.parse_args(argv)
+
+    db = SessionLocal()
+    try:
+        counts = backfill_coordinates(db, Geocoder(make_provider(args.provider)), args.batch_size)
+        for table, (resolved, unresolved) in counts.items():
+            print(f"{table}: geocoded {resolved}, unresolved {unresolved}")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
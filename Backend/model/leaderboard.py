@@ -0,0 +1,263 @@
+from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import event
+from model.model import LeaderboardWeekly
+from model.connect import SessionLocal, use_replica
+
+from datetime import date, timedelta
+import asyncio
+import hashlib
+import json
+import threading
+import time
+import os
+
+# -------- Weekly leaderboard snapshot ----------
+# The top-10 is shared by every user, so it is computed at most once per TTL
+# per worker and tagged with a content version for conditional GETs.
+
+LEADERBOARD_TTL_SECONDS = float(os.getenv("LEADERBOARD_TTL_SECONDS", "15"))
+TOP_N = 10
+
+_lock = threading.Lock()
+_snapshots = {}  # week_start -> (expires_at, version, entries)
+
+def current_week_start(today: date | None = None) -> date:
+    today = today or date.today()
+    return today - timedelta(days=today.weekday())  # Monday of current week
+
+def rank_avatar(rank: int) -> str:
+    return "🏆" if rank == 1 else "🌟" if rank == 2 else "🥉" if rank == 3 else "👤"
+
+def _load_top(db: Session, week_start: date):
+    entries = db.query(LeaderboardWeekly).options(joinedload(LeaderboardWeekly.user)).filter(
+        LeaderboardWeekly.week_start == week_start
+    ).order_by(LeaderboardWeekly.rank).limit(TOP_N).all()
+
+    return [
+        {
+            "rank": entry.rank,
+            "name": entry.user.name if entry.user else "",
+            "points": entry.points,
+            "avatar": rank_avatar(entry.rank),
+        }
+        for entry in entries
+    ]
+
+def _version_of(week_start: date, entries) -> str:
+    raw = str(week_start) + "|" + "|".join(f"{e['rank']}:{e['name']}:{e['points']}" for e in entries)
+    return hashlib.blake2s(raw.encode("utf-8"), digest_size=8).hexdigest()
+
+def get_top_snapshot(db: Session, week_start: date | None = None, refresh: bool = False):
+    """
+    Return (version, entries) for the week's top-10, refreshing after the TTL.
+    `refresh` reloads now; the result is cached for the normal TTL either way.
+    """
+    week_start = week_start or current_week_start()
+    now = time.monotonic()
+
+    if not refresh:
+        with _lock:
+            cached = _snapshots.get(week_start)
+            if cached and cached[0] > now:
+                return cached[1], cached[2]
+
+    entries = _load_top(db, week_start)
+    version = _version_of(week_start, entries)
+    with _lock:
+        # Only the current week is ever read, drop older snapshots
+        _snapshots.clear()
+        _snapshots[week_start] = (now + LEADERBOARD_TTL_SECONDS, version, entries)
+    return version, entries
+
+def invalidate_snapshot():
+    """Force the next read to reload (call after writing leaderboard rows)"""
+    with _lock:
+        _snapshots.clear()
+
+def get_user_entry(db: Session, user_id: int, week_start: date | None = None):
+    week_start = week_start or current_week_start()
+    return db.query(LeaderboardWeekly).filter(
+        LeaderboardWeekly.user_id == user_id,
+        LeaderboardWeekly.week_start == week_start
+    ).first()
+
+# -------- Live push ----------
+# One broadcaster per worker recomputes the top-10 (and the ranks of everyone
+# subscribed) once per tick and fans the diff out to all connections, instead
+# of each client polling the endpoint. Committing LeaderboardWeekly changes
+# through SessionLocal triggers a tick after a short coalescing window (see the
+# listeners at the bottom); a slow poll covers writes made by other processes.
+
+LEADERBOARD_COALESCE_SECONDS = float(os.getenv("LEADERBOARD_COALESCE_SECONDS", "1"))
+LEADERBOARD_POLL_SECONDS = float(os.getenv("LEADERBOARD_POLL_SECONDS", "10"))
+SUBSCRIBER_QUEUE_SIZE = 8
+
+def top_diff(old, new):
+    """Slots whose entry changed, plus the new list size (clients truncate to it)"""
+    upserts = [
+        {"slot": i, **entry}
+        for i, entry in enumerate(new)
+        if i >= len(old) or old[i] != entry
+    ]
+    if not upserts and len(old) == len(new):
+        return None
+    return {"type": "top_diff", "size": len(new), "upserts": upserts}
+
+def own_message(entry) -> dict:
+    return {"type": "you", "rank": entry[0], "points": entry[1]} if entry else {"type": "you", "rank": None, "points": None}
+
+class LeaderboardBroadcaster:
+    def __init__(self, session_factory, coalesce: float = LEADERBOARD_COALESCE_SECONDS, poll: float = LEADERBOARD_POLL_SECONDS):
+        self.session_factory = session_factory
+        self.coalesce = coalesce
+        self.poll = poll
+        self._subs = {}  # queue -> user_id
+        self._top = None  # last broadcast top-10
+        self._own = {}  # user_id -> (rank, points) last sent
+        self._loop = None
+        self._changed = None
+        self._task = None
+
+    # ---- computation (runs in a worker thread) ----
+    def _compute(self, user_ids):
+        db = use_replica(self.session_factory())
+        try:
+            week_start = current_week_start()
+            _, top = get_top_snapshot(db, week_start, refresh=True)
+            own = {}
+            if user_ids:
+                rows = db.query(LeaderboardWeekly.user_id, LeaderboardWeekly.rank, LeaderboardWeekly.points).filter(
+                    LeaderboardWeekly.week_start == week_start,
+                    LeaderboardWeekly.user_id.in_(list(user_ids))
+                ).all()
+                own = {user_id: (rank, points) for user_id, rank, points in rows}
+            return top, own
+        finally:
+            db.close()
+
+    # ---- subscriptions ----
+    async def subscribe(self, user_id: int):
+        """Register a connection; returns (queue, initial snapshot message)"""
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+            self._changed = asyncio.Event()
+
+        if self._top is None or user_id not in self._own:
+            top, own = await asyncio.to_thread(self._compute, {user_id})
+            if self._top is None:
+                self._top = top
+            self._own[user_id] = own.get(user_id)
+
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._subs[queue] = user_id
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        return queue, self._snapshot(user_id)
+
+    def unsubscribe(self, queue):
+        user_id = self._subs.pop(queue, None)
+        if user_id is not None and user_id not in self._subs.values():
+            self._own.pop(user_id, None)
+
+    def notify_changed(self):
+        """Thread-safe: schedule a (coalesced) recompute"""
+        if self._loop is not None and self._changed is not None:
+            self._loop.call_soon_threadsafe(self._changed.set)
+
+    def _snapshot(self, user_id: int) -> str:
+        return json.dumps({"type": "snapshot", "top": self._top or [], "you": own_message(self._own.get(user_id))}, ensure_ascii=False)
+
+    def _offer(self, queue, message: str):
+        try:
+            queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # Slow consumer: drop its backlog and resync it with a full snapshot
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(self._snapshot(self._subs[queue]))
+
+    # ---- ticking ----
+    async def _run(self):
+        try:
+            while self._subs:
+                try:
+                    await asyncio.wait_for(self._changed.wait(), timeout=self.poll)
+                    await asyncio.sleep(self.coalesce)
+                except asyncio.TimeoutError:
+                    pass
+                self._changed.clear()
+                if self._subs:
+                    await self.tick()
+        finally:
+            self._task = None
+
+    async def tick(self):
+        user_ids = set(self._subs.values())
+        try:
+            top, own = await asyncio.to_thread(self._compute, user_ids)
+        except Exception as e:
+            print(f"Leaderboard tick failed: {e}")
+            return
+
+        diff = top_diff(self._top or [], top)
+        self._top = top
+        shared = json.dumps(diff, ensure_ascii=False) if diff else None
+
+        changed_own = {}
+        for user_id in user_ids:
+            entry = own.get(user_id)
+            if self._own.get(user_id) != entry:
+                self._own[user_id] = entry
+                changed_own[user_id] = json.dumps(own_message(entry))
+
+        for queue, user_id in list(self._subs.items()):
+            if shared:
+                self._offer(queue, shared)
+            if user_id in changed_own:
+                self._offer(queue, changed_own[user_id])
+
+def notify_leaderboard_changed():
+    """Call after writing leaderboard rows so live subscribers get the update"""
+    invalidate_snapshot()
+    if broadcaster is not None:
+        broadcaster.notify_changed()
+
+broadcaster = None
+
+def get_broadcaster(session_factory) -> LeaderboardBroadcaster:
+    global broadcaster
+    if broadcaster is None:
+        broadcaster = LeaderboardBroadcaster(session_factory)
+    return broadcaster
+
+# -------- Change tracking ----------
+# after_flush / do_orm_execute note LeaderboardWeekly writes on the session;
+# after_commit of the outermost transaction notifies this worker's subscribers.
+
+_CHANGED_KEY = "leaderboard_changed"
+
+@event.listens_for(SessionLocal, "after_flush")
+def _record_leaderboard_flush(session, flush_context):
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, LeaderboardWeekly):
+            session.info[_CHANGED_KEY] = True
+            return
+
+@event.listens_for(SessionLocal, "do_orm_execute")
+def _record_leaderboard_bulk(orm_execute_state):
+    # query(...).update() / .delete() bypass the flush
+    if (orm_execute_state.is_update or orm_execute_state.is_delete) and orm_execute_state.bind_mapper is not None \
+            and orm_execute_state.bind_mapper.class_ is LeaderboardWeekly:
+        orm_execute_state.session.info[_CHANGED_KEY] = True
+
+@event.listens_for(SessionLocal, "after_commit")
+def _notify_leaderboard_commit(session):
+    if session.in_nested_transaction():
+        return  # savepoint release; wait for the outer commit
+    if session.info.pop(_CHANGED_KEY, False):
+        notify_leaderboard_changed()
+
+@event.listens_for(SessionLocal, "after_soft_rollback")
+def _drop_leaderboard_changes(session, previous_transaction):
+    if previous_transaction.parent is None:
+        session.info.pop(_CHANGED_KEY, None)
@@ -20,6 +20,9 @@ class User(Base):
     first_name = Column(String(120))
     last_name = Column(String(120))
     address = Column(String)
+    # Geocoded from address in the background (model/geocoding.py); NULL until then
+    latitude = Column(Float, nullable=True)
+    longitude = Column(Float, nullable=True)
     email = Column(String(255), unique=True, nullable=False, index=True)
     password_hash = Column(String(255), nullable=False)
     reset_token = Column(String(255), nullable=True)
@@ -50,14 +53,29 @@ class Scan(Base):
     longitude = Column(Float)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
+# ---------- Scan rollups (raw scans past retention, per user/day/material) ----------
+class ScanRollupDaily(Base):
+    __tablename__ = "scan_rollups_daily"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"), index=True)
+    day = Column(Date, nullable=False)
+    material = Column(String(50))             # normalized (lower-case) predicted_material
+    scans = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "day", "material", name="uq_rollup_user_day_material"),
+    )
+
 # ---------- Recycling Centers ----------
 class RecyclingCenter(Base):
     __tablename__ = "recycling_centers"
 
     id = Column(Integer, primary_key=True)
     name = Column(String(200), nullable=False)
-    latitude = Column(Float, nullable=False)
-    longitude = Column(Float, nullable=False)
+    # NULL for centers added by address only, until geocoded
+    latitude = Column(Float, nullable=True, index=True)
+    longitude = Column(Float, nullable=True)
     address = Column(String)
     phone = Column(String)
     website = Column(String)
@@ -106,6 +124,10 @@ class Badge(Base):
     description = Column(String)
     icon = Column(String)                      # optional: key or URL for an icon
     points_required = Column(Integer, default=0)
+    # Award rule: 'scans' | 'material' | 'streak' | 'co2' compared against threshold
+    rule_type = Column(String(20), index=True)
+    rule_material = Column(String(50))         # only for rule_type == 'material'
+    threshold = Column(Float, default=0.0)     # scans, days or grams of CO2
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     holders = relationship("UserBadge", back_populates="badge", cascade="all, delete-orphan")
@@ -128,3 +150,38 @@ class UserBadge(Base):
         UniqueConstraint("user_id", "badge_id", name="uq_user_badge_once"),
     )
 
+
+# ---------- User stats (running counters maintained per scan event) ----------
+class UserStats(Base):
+    __tablename__ = "user_stats"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    total_scans = Column(Integer, nullable=False, default=0)
+    co2_saved_g = Column(Float, nullable=False, default=0.0)
+    streak_days = Column(Integer, nullable=False, default=0)
+    last_scan_day = Column(Date)
+    version = Column(Integer, nullable=False, default=0)  # bumped on every change, used as ETag source
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+# ---------- Per-material scan counters ----------
+class UserMaterialStats(Base):
+    __tablename__ = "user_material_stats"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), index=True)
+    material = Column(String(50), nullable=False)
+    scans = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "material", name="uq_material_stats_user_material"),
+    )
+
+# ---------- Password reset tokens (only the SHA-256 digest is stored) ----------
+class PasswordResetToken(Base):
+    __tablename__ = "password_reset_tokens"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    token_hash = Column(String(64), unique=True, nullable=False, index=True)
+    expires_at = Column(DateTime, nullable=False, index=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -0,0 +1,111 @@
+from PIL import Image, ImageOps
+import numpy as np
+
+from contextlib import contextmanager
+import binascii
+import io
+import os
+import queue
+
+# -------- Image preprocessing for classification ----------
+# Phone photos arrive as ~12MP base64 JPEGs. Rather than decode them at full
+# resolution and shrink afterwards, the JPEG decoder is asked for a reduced
+# scale (draft mode, 1/2..1/8) close to the model input, EXIF orientation is
+# applied to that small image, and normalization writes straight into a
+# pooled CHW float32 buffer that torch.from_numpy() can wrap without a copy.
+# Draft mode does nothing for PNG/WebP/GIF, so images are rejected by their
+# header size (MAX_IMAGE_PIXELS) before anything is decoded.
+
+INPUT_SIZE = int(os.getenv("MODEL_INPUT_SIZE", "224"))
+# Ultralytics classifiers expect 0..1 inputs (mean 0, std 1); set ImageNet
+# values ("0.485,0.456,0.406" / "0.229,0.224,0.225") for torchvision models
+MEAN = np.array([float(v) for v in os.getenv("MODEL_INPUT_MEAN", "0,0,0").split(",")], dtype=np.float32)
+STD = np.array([float(v) for v in os.getenv("MODEL_INPUT_STD", "1,1,1").split(",")], dtype=np.float32)
+POOL_SIZE = int(os.getenv("PREPROCESS_POOL_SIZE", os.getenv("CLASSIFY_MAX_CONCURRENCY", "2")))
+# 24MP: twice a 12MP phone photo; a full decode of that is ~72MB of RGB
+MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", str(24_000_000)))
+
+class TensorBufferPool:
+    """Fixed set of preallocated (3, H, W) float32 buffers, reused across requests"""
+
+    def __init__(self, size: int = POOL_SIZE, input_size: int = INPUT_SIZE):
+        self.shape = (3, input_size, input_size)
+        self._free = queue.LifoQueue()
+        for _ in range(size):
+            self._free.put(np.empty(self.shape, dtype=np.float32))
+        self.capacity = size
+
+    @contextmanager
+    def borrow(self):
+        """Yield a buffer; if all are in use a temporary one is allocated instead of blocking"""
+        try:
+            buf = self._free.get_nowait()
+            pooled = True
+        except queue.Empty:
+            buf = np.empty(self.shape, dtype=np.float32)
+            pooled = False
+        try:
+            yield buf
+        finally:
+            if pooled:
+                self._free.put(buf)
+
+def decode_base64(image_data: str) -> bytes:
+    """Accepts raw base64 or a data URL (data:image/jpeg;base64,...)"""
+    if image_data.startswith("data:"):
+        image_data = image_data.split(",", 1)[1]
+    try:
+        return binascii.a2b_base64(image_data)
+    except binascii.Error as e:
+        raise ValueError(f"Invalid base64 image data: {e}")
+
+def load_image(raw: bytes, input_size: int = INPUT_SIZE, formats=None, max_pixels: int = MAX_IMAGE_PIXELS) -> Image.Image:
+    """
+    Decode at reduced resolution, apply EXIF orientation and center-crop to input_size.
+    Raises ValueError for unreadable images, formats outside `formats`, and
+    images over `max_pixels`.
+    """
+    try:
+        img = Image.open(io.BytesIO(raw), formats=formats)
+        # Header only so far: refuse oversized images before decoding them
+        width, height = img.size
+        if width * height > max_pixels:
+            raise ValueError(f"Image too large: {width}x{height} pixels (max {max_pixels})")
+        # JPEG only: decode at the smallest 1/2^n scale still >= input_size on both sides
+        img.draft("RGB", (input_size, input_size))
+        img = ImageOps.exif_transpose(img)
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+    except (OSError, SyntaxError, Image.DecompressionBombError) as e:
+        raise ValueError(f"Unreadable image: {e}")
+    return ImageOps.fit(img, (input_size, input_size), Image.BILINEAR)
+
+def normalize_into(img: Image.Image, out: np.ndarray, mean: np.ndarray = MEAN, std: np.ndarray = STD) -> np.ndarray:
+    """(pixel / 255 - mean) / std, HWC uint8 -> CHW float32 written into `out`"""
+    pixels = np.asarray(img).transpose(2, 0, 1)  # view, no copy
+    scale = (1.0 / (255.0 * std)).reshape(3, 1, 1)
+    shift = (mean / std).reshape(3, 1, 1)
+    np.multiply(pixels, scale, out=out)
+    np.subtract(out, shift, out=out)
+    return out
+
+pool = TensorBufferPool()
+
+@contextmanager
+def preprocess_bytes(raw: bytes, buffer_pool: TensorBufferPool = pool, formats=None, max_pixels: int = MAX_IMAGE_PIXELS):
+    """Encoded image bytes -> normalized (3, H, W) float32 array from the pool"""
+    img = load_image(raw, buffer_pool.shape[1], formats, max_pixels)
+    with buffer_pool.borrow() as buf:
+        yield normalize_into(img, buf)
+
+@contextmanager
+def preprocess(image_data: str, buffer_pool: TensorBufferPool = pool):
+    """
+    Base64 upload -> normalized (3, H, W) float32 array from the pool.
+    The array is only valid inside the `with` block:
+
+        with preprocess(request.image_data) as x:
+            logits = model(torch.from_numpy(x)[None])
+    """
+    with preprocess_bytes(decode_base64(image_data), buffer_pool) as x:
+        yield x
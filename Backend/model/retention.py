@@ -0,0 +1,119 @@
+"""
+Scan retention: fold raw scans older than the retention window into
+per-user/per-day/per-material rollups and move the raw rows to monthly
+archive files, so the hot `scans` table stays small.
+
+Run periodically (e.g. nightly from cron), from the Backend directory:
+    python -m model.retention --days 90
+"""
+from sqlalchemy.orm import Session
+from model.model import Scan, ScanRollupDaily
+from model.badges import normalize_material
+
+from datetime import datetime, timedelta
+import argparse
+import gzip
+import json
+import os
+
+SCAN_RETENTION_DAYS = int(os.getenv("SCAN_RETENTION_DAYS", "90"))
+SCAN_ARCHIVE_DIR = os.getenv(
+    "SCAN_ARCHIVE_DIR", os.path.join(os.path.dirname(os.path.dirname(__file__)), "archive", "scans")
+)
+BATCH_SIZE = 5000
+
+def _archive_row(scan: Scan) -> dict:
+    return {
+        "id": scan.id,
+        "user_id": scan.user_id,
+        "item_name": scan.item_name,
+        "predicted_material": scan.predicted_material,
+        "confidence": scan.confidence,
+        "decision": scan.decision,
+        "latitude": scan.latitude,
+        "longitude": scan.longitude,
+        "created_at": scan.created_at.isoformat() if scan.created_at else None,
+    }
+
+def archive_scans(scans, archive_dir: str = SCAN_ARCHIVE_DIR):
+    """Append scans as JSON lines to one gzip file per month (scans-YYYY-MM.jsonl.gz)"""
+    os.makedirs(archive_dir, exist_ok=True)
+    by_month = {}
+    for scan in scans:
+        by_month.setdefault(scan.created_at.strftime("%Y-%m"), []).append(scan)
+
+    for month, rows in by_month.items():
+        path = os.path.join(archive_dir, f"scans-{month}.jsonl.gz")
+        # Each append is a new gzip member; readers see one continuous stream
+        with gzip.open(path, "at", encoding="utf-8") as f:
+            for scan in rows:
+                f.write(json.dumps(_archive_row(scan)) + "\n")
+
+def _fold_into_rollups(db: Session, scans):
+    counts = {}
+    for scan in scans:
+        key = (scan.user_id, scan.created_at.date(), normalize_material(scan.predicted_material))
+        counts[key] = counts.get(key, 0) + 1
+
+    for (user_id, day, material), count in counts.items():
+        rollup = db.query(ScanRollupDaily).filter(
+            ScanRollupDaily.user_id == user_id if user_id is not None else ScanRollupDaily.user_id.is_(None),
+            ScanRollupDaily.day == day,
+            ScanRollupDaily.material == material if material is not None else ScanRollupDaily.material.is_(None),
+        ).first()
+        if rollup is None:
+            db.add(ScanRollupDaily(user_id=user_id, day=day, material=material, scans=count))
+        else:
+            rollup.scans += count
+
+def compact_scans(
+    db: Session,
+    older_than_days: int = SCAN_RETENTION_DAYS,
+    archive_dir: str = SCAN_ARCHIVE_DIR,
+    batch_size: int = BATCH_SIZE,
+) -> int:
+    """
+    Move scans created before the cutoff into rollups + archive files, one
+    batch per transaction. Per-user counters (user_stats) are unaffected, and
+    rebuilding them counts rollups, so every total stays identical.
+    Returns the number of raw scans compacted.
+    """
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    compacted = 0
+    while True:
+        batch = db.query(Scan).filter(
+            Scan.created_at < cutoff
+        ).order_by(Scan.id).limit(batch_size).all()
+        if not batch:
+            break
+
+        # Archive first: a crash before commit can at worst duplicate archive lines, never lose scans
+        archive_scans(batch, archive_dir)
+        _fold_into_rollups(db, batch)
+        db.query(Scan).filter(Scan.id.in_([scan.id for scan in batch])).delete(synchronize_session=False)
+        db.commit()
+        db.expunge_all()
+
+        compacted += len(batch)
+        if len(batch) < batch_size:
+            break
+    return compacted
+
+def main(argv=None):
+    from model.connect import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Compact old scans into daily rollups and archive files")
+    parser.add_argument("--days", type=int, default=SCAN_RETENTION_DAYS, help="keep raw scans newer than this")
+    parser.add_argument("--archive-dir", default=SCAN_ARCHIVE_DIR)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    db = SessionLocal()
+    try:
+        compacted = compact_scans(db, args.days, args.archive_dir, args.batch_size)
+        print(f"Compacted {compacted} scans older than {args.days} days into rollups")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+"""
+Prefork launcher for EcoSort API (Linux / macOS).
+
+The master imports the app and loads the classifier weights once, then forks
+the uvicorn workers, which share the model pages copy-on-write instead of each
+loading their own copy.
+
+    python prefork.py --workers 4 --port 8000
+
+Signals sent to the master:
+    SIGHUP          rolling restart, one worker at a time
+    SIGUSR1         print the memory-per-worker report
+    SIGTERM/SIGINT  graceful shutdown of all workers
+"""
+from dotenv import load_dotenv
+import argparse
+import gc
+import os
+import select
+import signal
+import socket
+import sys
+import time
+
+load_dotenv()
+
+WORKER_BOOT_TIMEOUT = 60
+WORKER_STOP_TIMEOUT = 30
+
+# -------- Memory report ----------
+
+def read_memory(pid: int) -> dict | None:
+    """Rss/Pss/shared/private kB for a process, from /proc/<pid>/smaps_rollup"""
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0].endswith(":") and parts[1].isdigit():
+                    fields[parts[0][:-1]] = int(parts[1])
+    except OSError:
+        return None
+    return {
+        "rss": fields.get("Rss", 0),
+        "pss": fields.get("Pss", 0),
+        "shared": fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0),
+        "private": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0),
+    }
+
+def memory_report(master_pid: int, worker_pids) -> str:
+    """
+    Pss is the process's fair share of shared pages, so summing Pss over the
+    master and workers gives the real footprint of the deployment.
+    """
+    lines = [f"{'process':<16}{'rss MB':>10}{'pss MB':>10}{'shared MB':>11}{'private MB':>12}"]
+    total_pss = 0
+    for label, pid in [("master", master_pid)] + [(f"worker {pid}", pid) for pid in worker_pids]:
+        mem = read_memory(pid)
+        if mem is None:
+            lines.append(f"{label:<16}{'n/a':>10}")
+            continue
+        total_pss += mem["pss"]
+        lines.append(
+            f"{label:<16}{mem['rss'] / 1024:>10.1f}{mem['pss'] / 1024:>10.1f}"
+            f"{mem['shared'] / 1024:>11.1f}{mem['private'] / 1024:>12.1f}"
+        )
+    lines.append(f"{'total pss':<16}{total_pss / 1024:>20.1f}")
+    return "\n".join(lines)
+
+# -------- Master ----------
+
+class Master:
+    def __init__(self, args):
+        self.args = args
+        self.pid = os.getpid()
+        self.workers = {}  # pid -> ready pipe fd (closed once ready)
+        self.restart_requested = False
+        self.report_requested = False
+        self.stopping = False
+
+    def preload(self):
+        # Importing main creates tables and runs the startup migrations once, here
+        import main
+        from model.connect import engine
+        from model.classifier import load_classifier
+
+        self.app = main.app
+        if not self.args.no_model:
+            try:
+                load_classifier()
+            except Exception as e:
+                print(f"Classifier preload failed, workers will load lazily: {e}")
+
+        # Connections must not be shared across fork
+        engine.dispose()
+
+        # Move everything allocated so far out of the GC's reach so collections
+        # in the workers don't write to (and un-share) these pages
+        gc.collect()
+        gc.freeze()
+
+    def bind(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.args.host, self.args.port))
+        sock.listen(2048)
+        sock.set_inheritable(True)
+        self.sock = sock
+
+    def spawn(self) -> int:
+        ready_r, ready_w = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(ready_r)
+            try:
+                run_worker(self.app, self.sock, ready_w, self.args)
+            finally:
+                os._exit(0)
+        os.close(ready_w)
+        self.workers[pid] = ready_r
+        return pid
+
+    def wait_ready(self, pid: int, timeout: float = WORKER_BOOT_TIMEOUT) -> bool:
+        fd = self.workers.get(pid)
+        if fd is None:
+            return True
+        readable, _, _ = select.select([fd], [], [], timeout)
+        ok = bool(readable) and os.read(fd, 1) == b"1"
+        os.close(fd)
+        self.workers[pid] = None
+        return ok
+
+    def stop_worker(self, pid: int, timeout: float = WORKER_STOP_TIMEOUT):
+        """SIGTERM lets uvicorn finish in-flight requests before exiting"""
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                done, _ = os.waitpid(pid, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if done:
+                break
+            time.sleep(0.1)
+        else:
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+        self._forget(pid)
+
+    def _forget(self, pid: int):
+        fd = self.workers.pop(pid, None)
+        if fd is not None:
+            os.close(fd)
+
+    def rolling_restart(self):
+        """Replace workers one by one; capacity never drops below N-1"""
+        for old_pid in list(self.workers):
+            new_pid = self.spawn()
+            if not self.wait_ready(new_pid):
+                print(f"Worker {new_pid} failed to start, keeping {old_pid}")
+                self.stop_worker(new_pid)
+                continue
+            self.stop_worker(old_pid)
+            print(f"Replaced worker {old_pid} with {new_pid}")
+
+    def reap(self):
+        """Respawn workers that exited without being asked to"""
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            if pid in self.workers:
+                self._forget(pid)
+                if not self.stopping:
+                    print(f"Worker {pid} exited ({status}), respawning")
+                    self.spawn()
+
+    def install_signals(self):
+        def on_hup(signum, frame):
+            self.restart_requested = True
+
+        def on_usr1(signum, frame):
+            self.report_requested = True
+
+        def on_term(signum, frame):
+            self.stopping = True
+
+        signal.signal(signal.SIGHUP, on_hup)
+        signal.signal(signal.SIGUSR1, on_usr1)
+        signal.signal(signal.SIGTERM, on_term)
+        signal.signal(signal.SIGINT, on_term)
+
+    def run(self):
+        self.preload()
+        self.bind()
+        for _ in range(self.args.workers):
+            self.spawn()
+        self.install_signals()
+        for pid in list(self.workers):
+            self.wait_ready(pid)
+        print(f"Master {self.pid} serving on {self.args.host}:{self.args.port} with {len(self.workers)} workers")
+        print(memory_report(self.pid, list(self.workers)))
+
+        last_report = time.monotonic()
+        while not self.stopping:
+            time.sleep(0.5)
+            self.reap()
+            if self.restart_requested:
+                self.restart_requested = False
+                self.rolling_restart()
+            interval = self.args.report_interval
+            if self.report_requested or (interval and time.monotonic() - last_report >= interval):
+                self.report_requested = False
+                last_report = time.monotonic()
+                print(memory_report(self.pid, list(self.workers)))
+
+        print("Shutting down workers")
+        for pid in list(self.workers):
+            self.stop_worker(pid)
+        self.sock.close()
+
+# -------- Worker ----------
+
+def run_worker(app, sock, ready_fd: int, args):
+    import uvicorn
+
+    for sig in (signal.SIGHUP, signal.SIGUSR1, signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, signal.SIG_DFL)
+
+    threads = os.getenv("TORCH_THREADS_PER_WORKER")
+    if threads:
+        import torch
+        torch.set_num_threads(int(threads))
+
+    class Server(uvicorn.Server):
+        async def startup(self, sockets=None):
+            await super().startup(sockets=sockets)
+            # Tell the master this worker accepts connections
+            os.write(ready_fd, b"1")
+            os.close(ready_fd)
+
+    config = uvicorn.Config(app, log_level=args.log_level, timeout_graceful_shutdown=WORKER_STOP_TIMEOUT)
+    Server(config).run(sockets=[sock])
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run EcoSort API with preforked workers")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "2")))
+    parser.add_argument("--report-interval", type=float, default=0, help="seconds between memory reports (0 = only on SIGUSR1)")
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument("--no-model", action="store_true", help="skip preloading the classifier")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    if not hasattr(os, "fork"):
+        sys.exit("prefork.py needs os.fork(); use `python main.py` on this platform")
+    Master(parse_args()).run()
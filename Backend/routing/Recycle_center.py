@@ -1,7 +1,10 @@
-from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi import APIRouter, HTTPException, Depends, Query, status
 from sqlalchemy.orm import Session
 from model.model import User
-from model.connect import SessionLocal
+from model.connect import SessionLocal, use_replica
+from model.geocoding import cached_coordinates, nearby_centers
+from routing.profile import get_current_user
+from pydantic import BaseModel
 
 router=APIRouter()
 
@@ -11,8 +14,61 @@ def get_db():
         yield db
     finally:
         db.close()
+
+class NearbyCenterOut(BaseModel):
+    id: int
+    name: str
+    address: str | None = None
+    phone: str | None = None
+    website: str | None = None
+    latitude: float
+    longitude: float
+    distance_km: float
+
 @router.get("/Center_detail")
 def get_center_detail(id: int):
     # TODO: Implement recycling center details
     pass
 
+@router.get("/centers/nearby", response_model=list[NearbyCenterOut])
+def get_nearby_centers(
+    lat: float | None = Query(None, ge=-90, le=90),
+    lon: float | None = Query(None, ge=-180, le=180),
+    radius_km: float = Query(10, gt=0, le=100),
+    limit: int = Query(20, ge=1, le=100),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """
+    Recycling centers near `lat`/`lon`, or near the user's address. Only
+    stored or cached coordinates are used; an address that has not been
+    geocoded yet gets a 409 until the background backfill reaches it.
+    """
+    if (lat is None) != (lon is None):
+        raise HTTPException(status_code=400, detail="Provide both lat and lon, or neither")
+    if lat is None:
+        if current_user.latitude is not None:
+            lat, lon = current_user.latitude, current_user.longitude
+        else:
+            coords = cached_coordinates(current_user.address)
+            if coords is None:
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail="Location for your address is not available yet"
+                )
+            lat, lon = coords
+
+    use_replica(db, current_user.id)
+    return [
+        {
+            "id": center.id,
+            "name": center.name,
+            "address": center.address,
+            "phone": center.phone,
+            "website": center.website,
+            "latitude": center.latitude,
+            "longitude": center.longitude,
+            "distance_km": round(distance, 2),
+        }
+        for center, distance in nearby_centers(db, lat, lon, radius_km, limit)
+    ]
@@ -0,0 +1,216 @@
+from jose import JWTError, jwt
+from routing.auth import SECRET_KEY, ALGORITHM
+
+import asyncio
+import json
+import math
+import os
+import time
+
+# -------- Admission control for inference routes ----------
+# Classification is slow and CPU bound. Without a ceiling, a burst of uploads
+# fills the worker's threadpool and every other route waits behind it. The
+# middleware below sheds classify requests early instead:
+#   * per-user token bucket            -> 429 + Retry-After
+#   * global concurrency ceiling        -> requests queue for a slot
+#   * estimated queue wait > deadline   -> 503 + Retry-After (before queueing)
+# The deadline comes from the client's X-Request-Deadline-Ms header (a budget
+# in milliseconds) and is exposed to the handler as scope["state"]["deadline"].
+
+CLASSIFY_MAX_CONCURRENCY = int(os.getenv("CLASSIFY_MAX_CONCURRENCY", "2"))
+CLASSIFY_MAX_QUEUE = int(os.getenv("CLASSIFY_MAX_QUEUE", "16"))
+CLASSIFY_RATE_PER_SEC = float(os.getenv("CLASSIFY_RATE_PER_SEC", "1"))
+CLASSIFY_BURST = float(os.getenv("CLASSIFY_BURST", "5"))
+CLASSIFY_DEFAULT_DEADLINE_MS = int(os.getenv("CLASSIFY_DEFAULT_DEADLINE_MS", "10000"))
+CLASSIFY_MAX_DEADLINE_MS = int(os.getenv("CLASSIFY_MAX_DEADLINE_MS", "30000"))
+# Half-life over which an inflated service-time estimate relaxes while idle
+CLASSIFY_SERVICE_DECAY_S = float(os.getenv("CLASSIFY_SERVICE_DECAY_S", "30"))
+
+DEADLINE_HEADER = b"x-request-deadline-ms"
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, burst: float, now: float):
+        self.tokens = burst
+        self.updated = now
+
+class AdmissionController:
+    def __init__(
+        self,
+        max_concurrency: int = CLASSIFY_MAX_CONCURRENCY,
+        max_queue: int = CLASSIFY_MAX_QUEUE,
+        rate_per_sec: float = CLASSIFY_RATE_PER_SEC,
+        burst: float = CLASSIFY_BURST,
+        initial_service_s: float = 1.0,
+        decay_half_life_s: float = CLASSIFY_SERVICE_DECAY_S,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.rate_per_sec = rate_per_sec
+        self.burst = burst
+        self.inflight = 0
+        self.waiting = 0
+        self.initial_service_s = initial_service_s
+        self.decay_half_life_s = decay_half_life_s
+        self.service_ewma_s = initial_service_s
+        self._sampled_at = time.monotonic()
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._buckets = {}
+
+    # ---- per-user rate limit ----
+    def take_token(self, key: str, now: float | None = None) -> float:
+        """Consume one token for `key`. Returns 0 if allowed, else seconds until a token is available"""
+        now = time.monotonic() if now is None else now
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) > 10000:
+                self._prune(now)
+            bucket = self._buckets[key] = TokenBucket(self.burst, now)
+
+        bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate_per_sec)
+        bucket.updated = now
+        if bucket.tokens >= 1:
+            bucket.tokens -= 1
+            return 0.0
+        return (1 - bucket.tokens) / self.rate_per_sec
+
+    def _prune(self, now: float):
+        # Buckets that have refilled completely carry no state worth keeping
+        full_after = self.burst / self.rate_per_sec
+        self._buckets = {k: b for k, b in self._buckets.items() if now - b.updated < full_after}
+
+    # ---- queue estimate ----
+    def service_estimate(self, now: float | None = None) -> float:
+        """
+        Service-time EWMA. Samples only arrive from admitted requests, so an
+        estimate above the initial guess (e.g. after a slow cold start) decays
+        back toward it while no samples come in; otherwise one slow spell
+        could shed every later request and never be corrected.
+        """
+        if self.service_ewma_s <= self.initial_service_s:
+            return self.service_ewma_s
+        now = time.monotonic() if now is None else now
+        weight = 0.5 ** (max(now - self._sampled_at, 0.0) / self.decay_half_life_s)
+        return self.initial_service_s + (self.service_ewma_s - self.initial_service_s) * weight
+
+    def estimated_wait(self, now: float | None = None) -> float:
+        """Seconds a new request would wait for a slot, from the service-time estimate"""
+        if self.inflight < self.max_concurrency:
+            return 0.0
+        return (self.waiting + 1) / self.max_concurrency * self.service_estimate(now)
+
+    def idle(self) -> bool:
+        return self.inflight == 0 and self.waiting == 0
+
+    def record_service_time(self, seconds: float, alpha: float = 0.2, now: float | None = None):
+        now = time.monotonic() if now is None else now
+        self.service_ewma_s = (1 - alpha) * self.service_estimate(now) + alpha * seconds
+        self._sampled_at = now
+
+    async def try_acquire(self) -> bool:
+        """Take a slot only if one is free right now (used to skip work rather than queue it)"""
+        if self._slots.locked():
+            return False
+        await self._slots.acquire()
+        self.inflight += 1
+        return True
+
+    async def acquire(self, timeout: float) -> bool:
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=max(timeout, 0))
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self.waiting -= 1
+        self.inflight += 1
+        return True
+
+    def release(self):
+        self.inflight -= 1
+        self._slots.release()
+
+# Shared by the HTTP middleware and the streaming classify socket so both count
+# against the same concurrency ceiling
+classify_controller = AdmissionController()
+
+def _request_key(headers: dict, scope) -> str:
+    """Rate-limit key: the authenticated user id, else the client address"""
+    auth = headers.get(b"authorization", b"").decode("latin-1")
+    if auth.lower().startswith("bearer "):
+        try:
+            payload = jwt.decode(auth[7:], SECRET_KEY, algorithms=[ALGORITHM])
+            if payload.get("sub") is not None:
+                return "user:" + str(payload["sub"])
+        except JWTError:
+            pass
+    client = scope.get("client")
+    return "ip:" + (client[0] if client else "unknown")
+
+def _deadline_budget(headers: dict) -> float:
+    """Client budget in seconds, clamped to the server maximum"""
+    raw = headers.get(DEADLINE_HEADER)
+    try:
+        budget_ms = int(raw) if raw else CLASSIFY_DEFAULT_DEADLINE_MS
+    except ValueError:
+        budget_ms = CLASSIFY_DEFAULT_DEADLINE_MS
+    return max(0, min(budget_ms, CLASSIFY_MAX_DEADLINE_MS)) / 1000
+
+async def _reject(send, status_code: int, detail: str, retry_after: float):
+    body = json.dumps({"detail": detail}).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status_code,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+class AdmissionMiddleware:
+    """ASGI middleware applying an AdmissionController to the given path prefixes"""
+
+    def __init__(self, app, paths=("/recycle/classify",), controller: AdmissionController | None = None):
+        self.app = app
+        self.paths = tuple(paths)
+        self.controller = controller or classify_controller
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "OPTIONS" or not scope["path"].startswith(self.paths):
+            return await self.app(scope, receive, send)
+
+        ctl = self.controller
+        headers = dict(scope["headers"])
+        started = time.monotonic()
+        budget = _deadline_budget(headers)
+        deadline = started + budget
+
+        retry_after = ctl.take_token(_request_key(headers, scope), started)
+        if retry_after:
+            return await _reject(send, 429, "Too many classification requests", retry_after)
+
+        service = ctl.service_estimate(started)
+        if ctl.idle():
+            # Nothing running: admit as a probe, whatever the estimate says. Its
+            # service time corrects an estimate left high by a slow spell.
+            wait_budget = deadline - time.monotonic()
+        else:
+            expected_wait = ctl.estimated_wait(started)
+            if ctl.waiting >= ctl.max_queue or expected_wait + service > budget:
+                return await _reject(send, 503, "Classification is busy, retry shortly", expected_wait or service)
+            # Leave room for the work itself inside the client's budget
+            wait_budget = deadline - time.monotonic() - service
+
+        if not await ctl.acquire(wait_budget):
+            return await _reject(send, 503, "Classification is busy, retry shortly", ctl.estimated_wait() or service)
+
+        scope.setdefault("state", {})["deadline"] = deadline
+        service_started = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            ctl.record_service_time(time.monotonic() - service_started)
+            ctl.release()
@@ -1,6 +1,6 @@
 from fastapi import APIRouter, HTTPException, Depends, status
 from sqlalchemy.orm import Session
-from model.model import User
+from model.model import User, PasswordResetToken
 from model.connect import SessionLocal
 from passlib.context import CryptContext
 from pydantic import BaseModel
@@ -11,6 +11,8 @@ import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import secrets
+import hashlib
+import asyncio
 
 router = APIRouter()
 
@@ -20,6 +22,8 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 SECRET_KEY = os.getenv("SECRET_KEY", "f704a7f4598c84ca47963e8b262b0e50665883541fe4f59cfc3e18e15326e760a9f56d02cee75a321539c7ec2389a6810af09ea1c5211e88d381f9ba9fe12865")  # Use env var
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+RESET_TOKEN_EXPIRE_HOURS = 1
+RESET_TOKEN_SWEEP_SECONDS = int(os.getenv("RESET_TOKEN_SWEEP_SECONDS", "900"))
 
 class LoginRequest(BaseModel):
     email: str
@@ -43,6 +47,9 @@ class LoginResponse(BaseModel):
     profile_complete: bool
     user_id: int
 
+class MessageResponse(BaseModel):
+    message: str
+
 class ForgotPasswordRequest(BaseModel):
     email: str
 
@@ -84,6 +91,32 @@ def is_profile_complete(user: User) -> bool:
     """Check if user has completed their profile (first_name, last_name, address)"""
     return bool(user.first_name and user.last_name and user.address)
 
+def hash_reset_token(token: str) -> str:
+    """Tokens are random 256-bit values, so a plain SHA-256 digest is enough to store them"""
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+def purge_expired_reset_tokens(db: Session) -> int:
+    """Bulk-delete expired reset tokens (range scan on the expires_at index)"""
+    deleted = db.query(PasswordResetToken).filter(
+        PasswordResetToken.expires_at <= datetime.utcnow()
+    ).delete(synchronize_session=False)
+    db.commit()
+    return deleted
+
+async def reset_token_sweeper(interval: int = RESET_TOKEN_SWEEP_SECONDS):
+    """Background loop purging expired reset tokens every `interval` seconds"""
+    while True:
+        await asyncio.sleep(interval)
+        db = SessionLocal()
+        try:
+            deleted = await asyncio.to_thread(purge_expired_reset_tokens, db)
+            if deleted:
+                print(f"Purged {deleted} expired reset tokens")
+        except Exception as e:
+            print(f"Reset token sweep failed: {e}")
+        finally:
+            db.close()
+
 def send_reset_email(email: str, reset_token: str):
     """Send password reset email using smtplib"""
     # For demo purposes, using a simple SMTP setup
@@ -185,20 +218,21 @@ async def signup(request: SignupRequest, db: Session = Depends(get_db)):
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
-@router.post("/forgot-password")
+@router.post("/forgot-password", response_model=MessageResponse)
 async def forgot_password(request: ForgotPasswordRequest, db: Session = Depends(get_db)):
     user = db.query(User).filter(User.email == request.email).first()
     if not user:
         # Don't reveal if email exists or not for security
         return {"message": "If an account with this email exists, a reset link has been sent."}
 
-    # Generate reset token
+    # Generate reset token; only its digest is stored and older tokens are revoked
     reset_token = secrets.token_urlsafe(32)
-    reset_token_expires = datetime.utcnow() + timedelta(hours=1)
-
-    # Update user with reset token
-    user.reset_token = reset_token
-    user.reset_token_expires = reset_token_expires
+    db.query(PasswordResetToken).filter(PasswordResetToken.user_id == user.id).delete(synchronize_session=False)
+    db.add(PasswordResetToken(
+        user_id=user.id,
+        token_hash=hash_reset_token(reset_token),
+        expires_at=datetime.utcnow() + timedelta(hours=RESET_TOKEN_EXPIRE_HOURS),
+    ))
     db.commit()
 
     # Send email
@@ -210,12 +244,13 @@ async def forgot_password(request: ForgotPasswordRequest, db: Session = Depends(
             detail="Failed to send reset email"
         )
 
-@router.post("/reset-password")
+@router.post("/reset-password", response_model=MessageResponse)
 async def reset_password(request: ResetPasswordRequest, db: Session = Depends(get_db)):
-    user = db.query(User).filter(
-        User.reset_token == request.token,
-        User.reset_token_expires > datetime.utcnow()
+    # Single probe on the unique token_hash index
+    reset = db.query(PasswordResetToken).filter(
+        PasswordResetToken.token_hash == hash_reset_token(request.token)
     ).first()
+    user = db.get(User, reset.user_id) if reset and reset.expires_at > datetime.utcnow() else None
 
     if not user:
         raise HTTPException(
@@ -225,8 +260,7 @@ async def reset_password(request: ResetPasswordRequest, db: Session = Depends(ge
 
     # Update password
     user.password_hash = get_password_hash(request.new_password)
-    user.reset_token = None
-    user.reset_token_expires = None
+    db.query(PasswordResetToken).filter(PasswordResetToken.user_id == user.id).delete(synchronize_session=False)
     db.commit()
 
     return {"message": "Password reset successfully"}
\ No newline at end of file
@@ -0,0 +1,36 @@
+from fastapi import Request, Response
+import hashlib
+
+# -------- Conditional GET helpers ----------
+# Handlers compute a cheap version tag first and bail out with 304 before
+# doing any aggregation work when the client already holds that version.
+
+DEFAULT_CACHE_CONTROL = "private, no-cache"
+
+def make_etag(*parts) -> str:
+    """Build a weak ETag from the version parts of a representation"""
+    raw = "|".join(str(p) for p in parts)
+    return 'W/"' + hashlib.blake2s(raw.encode("utf-8"), digest_size=8).hexdigest() + '"'
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against our ETag"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    for candidate in if_none_match.split(","):
+        if candidate.strip().removeprefix("W/") == opaque:
+            return True
+    return False
+
+def not_modified(request: Request, response: Response, etag: str, cache_control: str = DEFAULT_CACHE_CONTROL):
+    """
+    Attach ETag/Cache-Control to the response. Returns a ready 304 Response when
+    the request's If-None-Match already matches, otherwise None.
+    """
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
@@ -0,0 +1,216 @@
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
+from model.connect import SessionLocal
+from model.classifier import get_classifier, class_names, predict_probs
+from model.preprocess import decode_base64, preprocess_bytes
+from routing.admission import classify_controller
+from routing.profile import user_from_token
+import numpy as np
+
+import asyncio
+import os
+import time
+
+router = APIRouter()
+
+# -------- Live camera classification ----------
+# The app streams low-resolution frames (binary JPEG, or base64 text) over one
+# socket. Only the newest frame is kept: anything that arrives while a frame is
+# being classified replaces the pending one and is counted as dropped. Each
+# connection runs at most one inference at a time, no more than
+# CLASSIFY_STREAM_MAX_FPS per second, and only when a global classify slot is
+# free, so streams never queue behind (or in front of) /recycle/classify.
+# Frames must be low-resolution JPEGs. Anything over
+# CLASSIFY_STREAM_MAX_FRAME_BYTES, or any frame whose header declares more than
+# CLASSIFY_STREAM_MAX_PIXELS, is rejected without being decoded. Other formats
+# are refused outright: the byte cap alone does not bound decode cost, since a
+# small PNG can declare a huge canvas.
+
+CLASSIFY_STREAM_MAX_FPS = float(os.getenv("CLASSIFY_STREAM_MAX_FPS", "4"))
+CLASSIFY_STREAM_ALPHA = float(os.getenv("CLASSIFY_STREAM_ALPHA", "0.4"))
+CLASSIFY_STREAM_THRESHOLD = float(os.getenv("CLASSIFY_STREAM_THRESHOLD", "0.7"))
+CLASSIFY_STREAM_STABLE_FRAMES = int(os.getenv("CLASSIFY_STREAM_STABLE_FRAMES", "3"))
+CLASSIFY_STREAM_MAX_FRAME_BYTES = int(os.getenv("CLASSIFY_STREAM_MAX_FRAME_BYTES", str(256 * 1024)))
+CLASSIFY_STREAM_MAX_PIXELS = int(os.getenv("CLASSIFY_STREAM_MAX_PIXELS", str(1920 * 1080)))
+STREAM_FORMATS = ["JPEG"]
+
+class PredictionSmoother:
+    """Exponential moving average of class probabilities with a stability check"""
+
+    def __init__(
+        self,
+        alpha: float = CLASSIFY_STREAM_ALPHA,
+        threshold: float = CLASSIFY_STREAM_THRESHOLD,
+        stable_frames: int = CLASSIFY_STREAM_STABLE_FRAMES,
+    ):
+        self.alpha = alpha
+        self.threshold = threshold
+        self.stable_frames = stable_frames
+        self.probs = None
+        self.label = None
+        self.streak = 0
+        self.emitted = None  # label of the last result sent
+
+    def update(self, probs: np.ndarray):
+        """Returns (top index, smoothed confidence, whether a new stable result is ready)"""
+        if self.probs is None or self.probs.shape != probs.shape:
+            self.probs = probs.astype(np.float32)
+        else:
+            self.probs *= 1 - self.alpha
+            self.probs += self.alpha * probs
+
+        top = int(self.probs.argmax())
+        confidence = float(self.probs[top])
+        if top == self.label and confidence >= self.threshold:
+            self.streak += 1
+        else:
+            self.label = top
+            self.streak = 1 if confidence >= self.threshold else 0
+
+        ready = self.streak >= self.stable_frames and self.emitted != top
+        if ready:
+            self.emitted = top
+        return top, confidence, ready
+
+def _classify_frame(frame) -> np.ndarray:
+    model = get_classifier()
+    raw = frame if isinstance(frame, bytes) else decode_base64(frame)
+    with preprocess_bytes(raw, formats=STREAM_FORMATS, max_pixels=CLASSIFY_STREAM_MAX_PIXELS) as x:
+        return predict_probs(model, x)
+
+def _frame_size(frame) -> int:
+    """Encoded image size; base64 text is ~4/3 of the bytes it carries"""
+    return len(frame) if isinstance(frame, bytes) else len(frame) * 3 // 4
+
+def _release_when_done(started: float):
+    """
+    Done-callback for an inference future: the worker thread keeps running
+    even if the socket task is cancelled, so the slot is only given back once
+    the thread has actually finished.
+    """
+    def done(future):
+        classify_controller.record_service_time(time.monotonic() - started)
+        classify_controller.release()
+        if not future.cancelled():
+            future.exception()  # mark retrieved when nobody is left awaiting it
+    return done
+
+def _authenticate(token: str):
+    db = SessionLocal()
+    try:
+        return user_from_token(token, db).id
+    finally:
+        db.close()
+
+def _label(names, index: int) -> str:
+    return names[index] if index < len(names) else str(index)
+
+@router.websocket("/classify/stream")
+async def classify_stream(websocket: WebSocket, token: str):
+    """
+    Send frames, receive `prediction` messages (smoothed label per classified
+    frame) and a `result` once the same label has stayed above the confidence
+    threshold for CLASSIFY_STREAM_STABLE_FRAMES classified frames.
+    """
+    try:
+        user_id = await asyncio.to_thread(_authenticate, token)
+    except HTTPException:
+        await websocket.close(code=1008)
+        return
+
+    if classify_controller.take_token(f"user:{user_id}"):
+        await websocket.close(code=1013)  # try again later
+        return
+
+    await websocket.accept()
+    try:
+        names = class_names(await asyncio.to_thread(get_classifier))
+    except Exception as e:
+        print(f"Classifier unavailable for stream: {e}")
+        await websocket.close(code=1011)
+        return
+
+    latest = None
+    dropped = 0
+    frame_ready = asyncio.Event()
+    smoother = PredictionSmoother()
+    min_interval = 1 / CLASSIFY_STREAM_MAX_FPS
+
+    async def receive_frames():
+        nonlocal latest, dropped
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            frame = message.get("bytes") or message.get("text")
+            if not frame:
+                continue
+            if _frame_size(frame) > CLASSIFY_STREAM_MAX_FRAME_BYTES:
+                dropped += 1
+                await websocket.send_json({
+                    "type": "error",
+                    "detail": f"Frame larger than {CLASSIFY_STREAM_MAX_FRAME_BYTES} bytes; send low-resolution frames",
+                })
+                continue
+            if latest is not None:
+                dropped += 1  # never classified: a newer frame replaced it
+            latest = frame
+            frame_ready.set()
+
+    async def classify_frames():
+        nonlocal latest, dropped
+        next_allowed = 0.0
+        while True:
+            await frame_ready.wait()
+            delay = next_allowed - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            frame, latest = latest, None
+            frame_ready.clear()
+            if frame is None:
+                continue
+            if not await classify_controller.try_acquire():
+                dropped += 1  # server busy: skip rather than queue
+                next_allowed = time.monotonic() + min_interval
+                continue
+
+            started = time.monotonic()
+            next_allowed = started + min_interval
+            inference = asyncio.ensure_future(asyncio.to_thread(_classify_frame, frame))
+            inference.add_done_callback(_release_when_done(started))
+            try:
+                # shield: a disconnect cancels this task, not the running inference
+                probs = await asyncio.shield(inference)
+            except ValueError as e:
+                await websocket.send_json({"type": "error", "detail": str(e)})
+                continue
+            except Exception as e:
+                # One bad frame (or a model error) must not end the stream
+                print(f"Classify stream frame failed: {e!r}")
+                await websocket.send_json({"type": "error", "detail": "Could not classify frame"})
+                continue
+
+            top, confidence, ready = smoother.update(probs)
+            await websocket.send_json({
+                "type": "prediction",
+                "item_type": _label(names, top),
+                "confidence": round(confidence, 4),
+                "frames_dropped": dropped,
+            })
+            if ready:
+                await websocket.send_json({
+                    "type": "result",
+                    "item_type": _label(names, top),
+                    "confidence": round(confidence, 4),
+                })
+
+    tasks = [asyncio.create_task(receive_frames()), asyncio.create_task(classify_frames())]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            error = task.exception()
+            if error and not isinstance(error, WebSocketDisconnect):
+                print(f"Classify stream closed with error: {error!r}")
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,129 @@
+import gzip
+import os
+import zlib
+
+try:
+    import brotli
+except ImportError:  # optional: without it only gzip is offered
+    brotli = None
+
+# -------- Negotiated response compression ----------
+# Compresses JSON bodies for the given path prefixes with brotli or gzip,
+# whichever the client prefers (Accept-Encoding q-values), and leaves bodies
+# under COMPRESSION_MIN_SIZE alone: for tiny payloads the headers and CPU cost
+# more than the bytes saved.
+
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "512"))
+GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))  # low quality = cheap, still beats gzip on JSON
+
+COMPRESSIBLE_TYPES = (b"application/json", b"text/")
+
+def choose_encoding(accept_encoding: str) -> str | None:
+    """Pick 'br' or 'gzip' from an Accept-Encoding header (server prefers br on ties)"""
+    offered = ["gzip"] if brotli is None else ["gzip", "br"]
+    named = {}  # codings the client listed explicitly (q=0 means refused)
+    wildcard = 0.0
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if name == "*":
+            wildcard = q
+        elif name in offered:
+            named[name] = q
+
+    # `*` only covers codings the client did not name
+    quality = {name: named.get(name, wildcard) for name in offered}
+    best = max(offered, key=lambda n: (quality[n], n == "br"))
+    return best if quality[best] > 0 else None
+
+class _Compressor:
+    def __init__(self, encoding: str):
+        if encoding == "br":
+            self._obj = brotli.Compressor(quality=BROTLI_QUALITY)
+            self.compress, self.finish = self._obj.process, self._obj.finish
+        else:
+            self._obj = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # wbits 31 = gzip container
+            self.compress, self.finish = self._obj.compress, self._obj.flush
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+class CompressionMiddleware:
+    """ASGI middleware compressing responses under the given path prefixes"""
+
+    def __init__(self, app, paths=("/profile", "/recycle"), minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.paths = tuple(paths)
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.paths):
+            return await self.app(scope, receive, send)
+
+        accept = dict(scope["headers"]).get(b"accept-encoding", b"").decode("latin-1")
+        encoding = choose_encoding(accept) if accept else None
+        if encoding is None:
+            return await self.app(scope, receive, send)
+
+        start_message = None
+        compressor = None
+
+        async def send_wrapper(message):
+            nonlocal start_message, compressor
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+
+            if start_message is None or message["type"] != "http.response.body":
+                return await send(message)
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if compressor is not None:
+                # Streaming response already being compressed
+                chunk = compressor.compress(body)
+                if not more_body:
+                    chunk += compressor.finish()
+                return await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+            headers = start_message["headers"]
+            header_names = {k.lower() for k, _ in headers}
+            content_type = dict((k.lower(), v) for k, v in headers).get(b"content-type", b"")
+            eligible = (
+                b"content-encoding" not in header_names
+                and start_message["status"] not in (204, 304)
+                and content_type.startswith(COMPRESSIBLE_TYPES)
+            )
+
+            if not eligible or (not more_body and len(body) < self.minimum_size):
+                await send(start_message)
+                start_message = None
+                return await send(message)
+
+            headers = [(k, v) for k, v in headers if k.lower() != b"content-length"]
+            headers.append((b"content-encoding", encoding.encode()))
+            headers.append((b"vary", b"Accept-Encoding"))
+
+            if not more_body:
+                body = compress(body, encoding)
+                headers.append((b"content-length", str(len(body)).encode()))
+                await send({**start_message, "headers": headers})
+                start_message = None
+                return await send({"type": "http.response.body", "body": body})
+
+            compressor = _Compressor(encoding)
+            await send({**start_message, "headers": headers})
+            await send({"type": "http.response.body", "body": compressor.compress(body), "more_body": True})
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,49 @@
+from model.connect import READ_YOUR_WRITES_SECONDS, WriteWindow, current_write_window
+
+import time
+
+# -------- Read-your-writes across workers ----------
+# After a request commits a write, the response carries
+#   X-Read-Your-Writes-Until: <unix time>
+# and the client sends the value back until it passes. Any worker handling
+# those requests then keeps their reads on the primary (model/connect.py),
+# not just the worker that saw the write. The value only ever moves reads to
+# the primary, and is clamped to READ_YOUR_WRITES_SECONDS from now, so a
+# forged header cannot pin a client to the primary for long.
+
+READ_YOUR_WRITES_HEADER = "X-Read-Your-Writes-Until"
+_HEADER_KEY = READ_YOUR_WRITES_HEADER.lower().encode("latin-1")
+
+def _parse_until(raw: bytes | None) -> float:
+    if not raw:
+        return 0.0
+    try:
+        until = float(raw)
+    except ValueError:
+        return 0.0
+    return min(until, time.time() + READ_YOUR_WRITES_SECONDS)
+
+class ReadYourWritesMiddleware:
+    """ASGI middleware exposing the client's write window to the session router"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        window = WriteWindow(_parse_until(dict(scope["headers"]).get(_HEADER_KEY)))
+        token = current_write_window.set(window)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and window.recorded:
+                headers = list(message.get("headers", []))
+                headers.append((_HEADER_KEY, f"{window.until:.3f}".encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_write_window.reset(token)
@@ -1,15 +1,21 @@
-from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi import APIRouter, HTTPException, Depends, Request, Response, WebSocket, WebSocketDisconnect, status
 from sqlalchemy.orm import Session
 from sqlalchemy import func
-from model.model import User, Scan, ImpactDaily, LeaderboardWeekly, Badge, UserBadge
-from model.connect import SessionLocal
+from model.model import User, Badge, UserBadge
+from model.connect import SessionLocal, use_replica
+from model.badges import get_user_stats, current_streak, DEFAULT_BADGES
+from model.leaderboard import get_top_snapshot, get_user_entry, current_week_start, get_broadcaster
+from model.geocoding import cached_coordinates
+from routing.caching import make_etag, not_modified
+from routing.sparse import fieldset, sparse_response
 from passlib.context import CryptContext
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from jose import JWTError, jwt
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 
 import os
-from datetime import date, timedelta
+import asyncio
+from datetime import date, datetime
 
 security = HTTPBearer()
 SECRET_KEY = os.getenv("SECRET_KEY", "f704a7f4598c84ca47963e8b262b0e50665883541fe4f59cfc3e18e15326e760a9f56d02cee75a321539c7ec2389a6810af09ea1c5211e88d381f9ba9fe12865")
@@ -63,23 +69,57 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security), db: Session = Depends(get_db)):
+    return user_from_token(credentials.credentials, db)
+
+def user_from_token(token: str, db: Session) -> User:
+    """Resolve a bearer token to its user (also used by WebSocket routes, which have no headers dependency)"""
     try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id: str = payload.get("sub")
         if user_id is None:
             raise HTTPException(status_code=401, detail="Invalid authentication credentials")
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid authentication credentials")
 
+    # Always resolved on the primary; tags the session for read-your-writes routing
+    db.info["user_id"] = int(user_id)
     user = db.query(User).filter(User.id == int(user_id)).first()
     if user is None:
         raise HTTPException(status_code=401, detail="User not found")
     return user
 
+def get_read_db(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    """Request session whose reads may be served by a replica (read-only routes)"""
+    return use_replica(db, current_user.id)
+
 def is_profile_complete(user: User) -> bool:
     """Check if user has completed their profile (first_name, last_name, address)"""
     return bool(user.first_name and user.last_name and user.address)
 
+# Level thresholds (10 points per scan), highest first
+LEVELS = [
+    (1000, "Eco Champion"),
+    (500, "Planet Guardian"),
+    (250, "Eco Warrior"),
+    (100, "Green Enthusiast"),
+    (50, "Recycle Rookie"),
+    (0, "Beginner"),
+]
+
+def compute_level(total_points: int):
+    """Return (current_level, next_level, points_to_next) for a points total"""
+    for i, (threshold, name) in enumerate(LEVELS):
+        if total_points >= threshold:
+            if i == 0:
+                return name, None, 0
+            next_threshold, next_name = LEVELS[i - 1]
+            return name, next_name, next_threshold - total_points
+    return LEVELS[-1][1], LEVELS[-2][1], LEVELS[-2][0] - total_points
+
+def stats_etag(kind: str, stats, *extra) -> str:
+    """Version tag for per-user stats views; the streak also depends on today's date"""
+    return make_etag(kind, stats.user_id, stats.version, date.today(), *extra)
+
 # Update own profile (authenticated)
 class UpdateProfileRequest(BaseModel):
     name: str | None = None
@@ -94,7 +134,69 @@ class CompleteProfileRequest(BaseModel):
     address: str
     name: str | None = None
 
-@router.put("/profile", status_code=status.HTTP_200_OK)
+# ---------- Response schemas ----------
+class UserOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    name: str
+    email: str
+    created_at: datetime | None = None
+
+class UserProfileOut(UserOut):
+    first_name: str | None = None
+    last_name: str | None = None
+    address: str | None = None
+
+class ProfileResponse(UserProfileOut):
+    total_scans: int
+    co2_saved: float
+    level: str
+
+class CompleteProfileResponse(BaseModel):
+    message: str
+    profile_complete: bool
+    user: UserProfileOut
+
+class ProfileStatusResponse(BaseModel):
+    profile_complete: bool
+    missing_fields: list[str]
+
+class RewardsStatsResponse(BaseModel):
+    total_points: int
+    current_level: str
+    next_level: str | None
+    points_to_next: int
+    items_scanned: int
+    co2_saved: float
+    streak_days: int
+
+class BadgeOut(BaseModel):
+    name: str
+    earned: bool
+    awarded_at: datetime | None = None
+    reason: str | None = None
+
+class LeaderboardEntryOut(BaseModel):
+    rank: int
+    name: str
+    points: int
+    avatar: str
+
+class MilestoneOut(BaseModel):
+    goal: str
+    progress: float
+    total: int
+    reward: str
+
+def set_address(user: User, address: str):
+    """Change the address and its coordinates: from the geocode cache if known, else left for the backfill"""
+    if address == user.address and user.latitude is not None:
+        return
+    user.address = address
+    user.latitude, user.longitude = cached_coordinates(address) or (None, None)
+
+@router.put("/profile", response_model=UserProfileOut, status_code=status.HTTP_200_OK)
 def update_my_profile(
     payload: UpdateProfileRequest,
     db: Session = Depends(get_db),
@@ -111,59 +213,46 @@ def update_my_profile(
     if payload.last_name is not None:
         user.last_name = payload.last_name
     if payload.address is not None:
-        user.address = payload.address
+        set_address(user, payload.address)
 
     db.commit()
     db.refresh(user)
-    return {
-        "id": user.id,
-        "email": user.email,
-        "name": user.name,
-        "first_name": user.first_name,
-        "last_name": user.last_name,
-        "address": user.address,
-        "created_at": str(user.created_at),
-    }
+    return user
 
 # Get user Data
-@router.get("/profile_data")
-def fetch_user_data(id: int, db: Session = Depends(get_db)):
+@router.get("/profile_data", response_model=UserOut)
+def fetch_user_data(id: int, db: Session = Depends(get_db), fields: set[str] | None = Depends(fieldset(UserOut))):
+    use_replica(db)
     user = db.query(User).filter(User.id == id).first()
     if user:
-        return {
-            "id": user.id,
-            "name": user.name,
-            "email": user.email,
-            "created_at": str(user.created_at)
-        }
+        return sparse_response(user, fields, UserOut)
     else:
         raise HTTPException(status_code=404, detail="User not found")
 
-@router.get("/profile")
-def get_profile(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    # Calculate total scans
-    total_scans = db.query(Scan).filter(Scan.user_id == current_user.id).count()
-
-    # Calculate total CO2 saved (in kg)
-    co2_result = db.query(func.sum(ImpactDaily.co2_saved_g)).filter(ImpactDaily.user_id == current_user.id).scalar()
-    co2_saved = (co2_result or 0) / 1000  # Convert grams to kg
+@router.get("/profile", response_model=ProfileResponse)
+def get_profile(
+    request: Request,
+    response: Response,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_read_db),
+    fields: set[str] | None = Depends(fieldset(ProfileResponse)),
+):
+    stats = get_user_stats(db, current_user.id)
+    etag = stats_etag(
+        "profile", stats, current_user.email, current_user.name,
+        current_user.first_name, current_user.last_name, current_user.address
+    )
+    cached = not_modified(request, response, etag)
+    if cached:
+        return cached
+
+    total_scans = stats.total_scans
+    co2_saved = (stats.co2_saved_g or 0) / 1000  # Convert grams to kg
 
     # Level system based on points (10 points per scan)
-    total_points = total_scans * 10
-    if total_points >= 1000:
-        level = "Eco Champion"
-    elif total_points >= 500:
-        level = "Planet Guardian"
-    elif total_points >= 250:
-        level = "Eco Warrior"
-    elif total_points >= 100:
-        level = "Green Enthusiast"
-    elif total_points >= 50:
-        level = "Recycle Rookie"
-    else:
-        level = "Beginner"
+    level, _, _ = compute_level(total_scans * 10)
 
-    return {
+    return sparse_response({
         "id": current_user.id,
         "email": current_user.email,
         "name": current_user.name,
@@ -173,10 +262,10 @@ def get_profile(current_user: User = Depends(get_current_user), db: Session = De
         "total_scans": total_scans,
         "co2_saved": round(co2_saved, 2),
         "level": level,
-        "created_at": str(current_user.created_at)
-    }
+        "created_at": current_user.created_at
+    }, fields, ProfileResponse, response)
 
-@router.post("/complete-profile")
+@router.post("/complete-profile", response_model=CompleteProfileResponse)
 def complete_profile(
     profile_data: CompleteProfileRequest,
     db: Session = Depends(get_db),
@@ -186,7 +275,7 @@ def complete_profile(
     # Update user profile
     current_user.first_name = profile_data.first_name
     current_user.last_name = profile_data.last_name
-    current_user.address = profile_data.address
+    set_address(current_user, profile_data.address)
 
     if profile_data.name:
         current_user.name = profile_data.name
@@ -197,21 +286,16 @@ def complete_profile(
     return {
         "message": "Profile completed successfully",
         "profile_complete": True,
-        "user": {
-            "id": current_user.id,
-            "email": current_user.email,
-            "name": current_user.name,
-            "first_name": current_user.first_name,
-            "last_name": current_user.last_name,
-            "address": current_user.address,
-            "created_at": str(current_user.created_at)
-        }
+        "user": current_user
     }
 
-@router.get("/check-profile-status")
-def check_profile_status(current_user: User = Depends(get_current_user)):
+@router.get("/check-profile-status", response_model=ProfileStatusResponse)
+def check_profile_status(
+    current_user: User = Depends(get_current_user),
+    fields: set[str] | None = Depends(fieldset(ProfileStatusResponse)),
+):
     """Check if current user's profile is complete"""
-    return {
+    return sparse_response({
         "profile_complete": is_profile_complete(current_user),
         "missing_fields": [
             field for field, value in [
@@ -220,9 +304,9 @@ def check_profile_status(current_user: User = Depends(get_current_user)):
                 ("address", current_user.address)
             ] if not value
         ]
-    }
+    }, fields, ProfileStatusResponse)
 
-@router.post("/insert_profile_data", status_code=status.HTTP_201_CREATED)
+@router.post("/insert_profile_data", response_model=UserOut, status_code=status.HTTP_201_CREATED)
 def insert_user_data(name: str, email: str, password: str, db: Session = Depends(get_db)):
     """
     Insert User Data to the table
@@ -234,7 +318,7 @@ def insert_user_data(name: str, email: str, password: str, db: Session = Depends
     db.refresh(db_user)
     return db_user
 
-@router.put("/update_profile_data")
+@router.put("/update_profile_data", response_model=UserOut)
 def update_user_data(id: int, name: str = None, email: str = None, db: Session = Depends(get_db)):
     """
     Update User Data in the table
@@ -252,7 +336,7 @@ def update_user_data(id: int, name: str = None, email: str = None, db: Session =
     db.refresh(user)
     return user
 
-@router.put("/update_password")
+@router.put("/update_password", response_model=UserOut)
 def update_password(id: int, password: str, db: Session = Depends(get_db)):
     """Update Password"""
     user = db.query(User).filter(User.id == id).first()
@@ -267,68 +351,37 @@ def update_password(id: int, password: str, db: Session = Depends(get_db)):
     db.refresh(user)
     return user
 
-@router.get("/rewards/stats")
-def get_rewards_stats(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+@router.get("/rewards/stats", response_model=RewardsStatsResponse)
+def get_rewards_stats(
+    request: Request,
+    response: Response,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_read_db),
+    fields: set[str] | None = Depends(fieldset(RewardsStatsResponse)),
+):
     """Get user's rewards statistics"""
     try:
-        total_scans = db.query(Scan).filter(Scan.user_id == current_user.id).count()
-        co2_result = db.query(func.sum(ImpactDaily.co2_saved_g)).filter(ImpactDaily.user_id == current_user.id).scalar()
-        co2_saved = (co2_result or 0) / 1000  # Convert to kg
-
-        # Calculate streak (consecutive days with scans)
-        scan_dates_query = db.query(Scan.created_at).filter(Scan.user_id == current_user.id).order_by(Scan.created_at.desc()).all()
-        scan_dates = [d[0].date() for d in scan_dates_query]
-        unique_dates = sorted(list(set(scan_dates)), reverse=True)
-
-        streak = 0
-        check_date = date.today()
-        for d in unique_dates:
-            if d == check_date:
-                streak += 1
-                check_date -= timedelta(days=1)
-            elif d > check_date:
-                continue
-            else:
-                break
+        stats = get_user_stats(db, current_user.id)
+        cached = not_modified(request, response, stats_etag("stats", stats))
+        if cached:
+            return cached
+
+        total_scans = stats.total_scans
+        co2_saved = (stats.co2_saved_g or 0) / 1000  # Convert to kg
 
         # Calculate points (10 points per scan)
         total_points = total_scans * 10
+        current_level, next_level, points_to_next = compute_level(total_points)
 
-        # Level calculation
-        if total_points >= 1000:
-            current_level = "Eco Champion"
-            next_level = None
-            points_to_next = 0
-        elif total_points >= 500:
-            current_level = "Planet Guardian"
-            next_level = "Eco Champion"
-            points_to_next = 1000 - total_points
-        elif total_points >= 250:
-            current_level = "Eco Warrior"
-            next_level = "Planet Guardian"
-            points_to_next = 500 - total_points
-        elif total_points >= 100:
-            current_level = "Green Enthusiast"
-            next_level = "Eco Warrior"
-            points_to_next = 250 - total_points
-        elif total_points >= 50:
-            current_level = "Recycle Rookie"
-            next_level = "Green Enthusiast"
-            points_to_next = 100 - total_points
-        else:
-            current_level = "Beginner"
-            next_level = "Recycle Rookie"
-            points_to_next = 50 - total_points
-
-        return {
+        return sparse_response({
             "total_points": total_points,
             "current_level": current_level,
             "next_level": next_level,
             "points_to_next": points_to_next,
             "items_scanned": total_scans,
             "co2_saved": round(co2_saved, 2),
-            "streak_days": streak
-        }
+            "streak_days": current_streak(stats)
+        }, fields, RewardsStatsResponse, response)
     except Exception as e:
         return {
             "total_points": 0,
@@ -340,79 +393,64 @@ def get_rewards_stats(current_user: User = Depends(get_current_user), db: Sessio
             "streak_days": 0
         }
 
-@router.get("/rewards/badges")
-def get_user_badges(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    """Get user's earned badges based on current stats"""
+@router.get("/rewards/badges", response_model=list[BadgeOut])
+def get_user_badges(
+    request: Request,
+    response: Response,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_read_db),
+    fields: set[str] | None = Depends(fieldset(list[BadgeOut])),
+):
+    """Get the badge catalog with the user's awards (awarded by the badge engine on each scan)"""
     try:
-        # Calculate current stats
-        total_scans = db.query(Scan).filter(Scan.user_id == current_user.id).count()
-
-        # Calculate streak
-        scan_dates_query = db.query(Scan.created_at).filter(Scan.user_id == current_user.id).order_by(Scan.created_at.desc()).all()
-        scan_dates = [d[0].date() for d in scan_dates_query]
-        unique_dates = sorted(list(set(scan_dates)), reverse=True)
-
-        streak = 0
-        check_date = date.today()
-        for d in unique_dates:
-            if d == check_date:
-                streak += 1
-                check_date -= timedelta(days=1)
-            elif d > check_date:
-                continue
-            else:
-                break
-
-        # Determine earned badges based on achievements
-        all_badges = [
-            {"name": "First Scan", "earned": total_scans >= 1},
-            {"name": "Streak Master", "earned": streak >= 7},
-            {"name": "Plastic Pro", "earned": total_scans >= 50},
-            {"name": "Glass Guardian", "earned": total_scans >= 100},
-            {"name": "Metal Master", "earned": total_scans >= 150},
-            {"name": "E-waste Expert", "earned": total_scans >= 200}
-        ]
-
-        return all_badges
+        # Backfills counters and awards for users that predate the engine
+        stats = get_user_stats(db, current_user.id)
+        catalog_size = db.query(func.count(Badge.id)).scalar()
+        cached = not_modified(request, response, stats_etag("badges", stats, catalog_size))
+        if cached:
+            return cached
+
+        rows = db.query(Badge, UserBadge).outerjoin(
+            UserBadge, (UserBadge.badge_id == Badge.id) & (UserBadge.user_id == current_user.id)
+        ).order_by(Badge.id).all()
+
+        return sparse_response([
+            {
+                "name": badge.name,
+                "earned": award is not None,
+                "awarded_at": award.awarded_at if award else None,
+                "reason": award.reason if award else None,
+            }
+            for badge, award in rows
+        ], fields, list[BadgeOut], response)
     except Exception as e:
-        # Return default badges if error
-        return [
-            {"name": "First Scan", "earned": False},
-            {"name": "Streak Master", "earned": False},
-            {"name": "Plastic Pro", "earned": False},
-            {"name": "Glass Guardian", "earned": False},
-            {"name": "Metal Master", "earned": False},
-            {"name": "E-waste Expert", "earned": False}
-        ]
+        # Return the catalog unearned if error
+        return [{"name": spec["name"], "earned": False} for spec in DEFAULT_BADGES]
 
-@router.get("/rewards/leaderboard")
-def get_leaderboard(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+@router.get("/rewards/leaderboard", response_model=list[LeaderboardEntryOut])
+def get_leaderboard(
+    request: Request,
+    response: Response,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_read_db),
+    fields: set[str] | None = Depends(fieldset(list[LeaderboardEntryOut])),
+):
     """Get weekly leaderboard"""
     try:
-        from datetime import datetime, timedelta
-        today = date.today()
-        week_start = today - timedelta(days=today.weekday())  # Monday of current week
+        week_start = current_week_start()
 
-        # Get leaderboard entries for current week
-        leaderboard_entries = db.query(LeaderboardWeekly).options(db.joinedload(LeaderboardWeekly.user)).filter(
-            LeaderboardWeekly.week_start == week_start
-        ).order_by(LeaderboardWeekly.rank).limit(10).all()
+        # Shared top-10 snapshot plus one indexed lookup for the caller's own row
+        version, top_entries = get_top_snapshot(db, week_start)
+        user_entry = get_user_entry(db, current_user.id, week_start)
+        own = (user_entry.rank, user_entry.points) if user_entry else None
 
-        leaderboard = []
-        for entry in leaderboard_entries:
-            leaderboard.append({
-                "rank": entry.rank,
-                "name": entry.user.name,
-                "points": entry.points,
-                "avatar": "🏆" if entry.rank == 1 else "🌟" if entry.rank == 2 else "🥉" if entry.rank == 3 else "👤"
-            })
+        cached = not_modified(request, response, make_etag("leaderboard", version, own))
+        if cached:
+            return cached
 
-        # Add current user if not in top 10
-        user_entry = db.query(LeaderboardWeekly).filter(
-            LeaderboardWeekly.user_id == current_user.id,
-            LeaderboardWeekly.week_start == week_start
-        ).first()
+        leaderboard = list(top_entries)
 
+        # Add current user if not in top 10
         if user_entry and user_entry.rank > 10:
             leaderboard.append({
                 "rank": user_entry.rank,
@@ -421,33 +459,75 @@ def get_leaderboard(current_user: User = Depends(get_current_user), db: Session
                 "avatar": "🏆"
             })
 
-        return leaderboard
+        return sparse_response(leaderboard, fields, list[LeaderboardEntryOut], response)
     except Exception as e:
         return []
 
-@router.get("/rewards/milestones")
-def get_milestones(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def _authenticate_ws(token: str):
+    db = SessionLocal()
+    try:
+        return user_from_token(token, db).id
+    finally:
+        db.close()
+
+@router.websocket("/rewards/leaderboard/live")
+async def leaderboard_live(websocket: WebSocket, token: str):
+    """
+    Push the weekly leaderboard instead of polling it. Sends a `snapshot`
+    first, then `top_diff` (changed slots + new size) and `you` (own rank)
+    messages as scores move. Authenticate with ?token=<access token>.
+    """
+    try:
+        user_id = await asyncio.to_thread(_authenticate_ws, token)
+    except HTTPException:
+        await websocket.close(code=1008)
+        return
+
+    await websocket.accept()
+    broadcaster = get_broadcaster(SessionLocal)
+    queue, snapshot = await broadcaster.subscribe(user_id)
+
+    async def pump():
+        await websocket.send_text(snapshot)
+        while True:
+            await websocket.send_text(await queue.get())
+
+    async def drain():
+        # Clients only listen; this returns when the socket closes
+        while True:
+            await websocket.receive_text()
+
+    tasks = [asyncio.create_task(pump()), asyncio.create_task(drain())]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            # asyncio.wait never raises; retrieve so a disconnect isn't logged as unhandled
+            error = task.exception()
+            if error and not isinstance(error, WebSocketDisconnect):
+                print(f"Leaderboard stream closed with error: {error}")
+    finally:
+        for task in tasks:
+            task.cancel()
+        broadcaster.unsubscribe(queue)
+
+@router.get("/rewards/milestones", response_model=list[MilestoneOut])
+def get_milestones(
+    request: Request,
+    response: Response,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_read_db),
+    fields: set[str] | None = Depends(fieldset(list[MilestoneOut])),
+):
     """Get current goals/milestones"""
     try:
-        total_scans = db.query(Scan).filter(Scan.user_id == current_user.id).count()
-        co2_result = db.query(func.sum(ImpactDaily.co2_saved_g)).filter(ImpactDaily.user_id == current_user.id).scalar()
-        co2_saved = (co2_result or 0) / 1000  # Convert to kg
-
-        # Calculate streak
-        scan_dates_query = db.query(Scan.created_at).filter(Scan.user_id == current_user.id).order_by(Scan.created_at.desc()).all()
-        scan_dates = [d[0].date() for d in scan_dates_query]
-        unique_dates = sorted(list(set(scan_dates)), reverse=True)
-
-        streak = 0
-        check_date = date.today()
-        for d in unique_dates:
-            if d == check_date:
-                streak += 1
-                check_date -= timedelta(days=1)
-            elif d > check_date:
-                continue
-            else:
-                break
+        stats = get_user_stats(db, current_user.id)
+        cached = not_modified(request, response, stats_etag("milestones", stats))
+        if cached:
+            return cached
+
+        total_scans = stats.total_scans
+        co2_saved = (stats.co2_saved_g or 0) / 1000  # Convert to kg
+        streak = current_streak(stats)
 
         milestones = [
             {"goal": "Scan 150 items", "progress": min(total_scans, 150), "total": 150, "reward": "+500 points"},
@@ -455,7 +535,7 @@ def get_milestones(current_user: User = Depends(get_current_user), db: Session =
             {"goal": "30-day streak", "progress": min(streak, 30), "total": 30, "reward": "Premium features"}
         ]
 
-        return milestones
+        return sparse_response(milestones, fields, list[MilestoneOut], response)
     except Exception as e:
         return [
             {"goal": "Scan 150 items", "progress": 0, "total": 150, "reward": "+500 points"},
@@ -0,0 +1,63 @@
+from fastapi import HTTPException, Query, Response, status
+from fastapi.responses import ORJSONResponse
+from pydantic import TypeAdapter
+from functools import lru_cache
+import typing
+
+# -------- Sparse fieldsets ----------
+# `?fields=a,b` limits a response to the named fields. The filter is applied
+# when the response model is dumped, so unrequested fields are never encoded.
+
+def _item_model(model_type):
+    """The BaseModel behind `Model` or `list[Model]`"""
+    if typing.get_origin(model_type) is list:
+        return typing.get_args(model_type)[0], True
+    return model_type, False
+
+def fieldset(model_type):
+    """
+    Dependency parsing `?fields=` for a route returning `model_type`
+    (`Model` or `list[Model]`); unknown names are rejected with 400.
+    """
+    allowed = set(_item_model(model_type)[0].model_fields)
+
+    def dependency(
+        fields: str | None = Query(None, description="Comma-separated response fields to include"),
+    ) -> set[str] | None:
+        if not fields:
+            return None
+        requested = {f.strip() for f in fields.split(",") if f.strip()}
+        unknown = requested - allowed
+        if unknown:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unknown fields: {', '.join(sorted(unknown))}"
+            )
+        return requested or None
+
+    return dependency
+
+@lru_cache(maxsize=None)
+def _adapter(model_type):
+    return TypeAdapter(model_type)
+
+def sparse_response(content, fields: set[str] | None, model_type, response: Response | None = None):
+    """
+    Return `content` unchanged when no fieldset was requested (FastAPI then
+    applies the route's response_model as usual); otherwise validate it as
+    `model_type` and render only the requested fields. Headers already set on
+    `response` (ETag, Cache-Control) are carried over.
+    """
+    if fields is None:
+        return content
+
+    _, is_list = _item_model(model_type)
+    adapter = _adapter(model_type)
+    value = adapter.validate_python(content, from_attributes=True)
+    include = {"__all__": fields} if is_list else fields
+    rendered = ORJSONResponse(adapter.dump_python(value, mode="json", include=include))
+    if response is not None:
+        for key, val in response.headers.items():
+            if key.lower() not in ("content-length", "content-type"):
+                rendered.headers[key] = val
+    return rendered
@@ -0,0 +1,35 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# model.connect builds its engines at import time, so point it at a scratch
+# SQLite file before any application module is imported.
+_tmp = tempfile.mkdtemp(prefix="ecosort-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp, 'ecosort.db')}"
+os.environ["DATABASE_REPLICA_URLS"] = ""
+os.environ["GEOCODE_CACHE_PATH"] = os.path.join(_tmp, "geocode.sqlite3")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from model.connect import engine, SessionLocal  # noqa: E402
+from model.model import Base  # noqa: E402
+
+@pytest.fixture
+def db():
+    Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+        Base.metadata.drop_all(bind=engine)
+
+@pytest.fixture
+def user(db):
+    from model.model import User
+
+    user = User(name="Tester", email="tester@example.com", password_hash="x")
+    db.add(user)
+    db.commit()
+    return user
@@ -0,0 +1,62 @@
+import asyncio
+
+from routing.admission import AdmissionController, AdmissionMiddleware
+
+def test_token_bucket_allows_burst_then_reports_wait():
+    ctl = AdmissionController(rate_per_sec=1, burst=2)
+    assert ctl.take_token("user:1", now=100.0) == 0
+    assert ctl.take_token("user:1", now=100.0) == 0
+    assert ctl.take_token("user:1", now=100.0) == 1.0
+    assert ctl.take_token("user:2", now=100.0) == 0
+    assert ctl.take_token("user:1", now=101.0) == 0
+
+def test_estimated_wait_only_when_slots_are_full():
+    ctl = AdmissionController(max_concurrency=2, initial_service_s=1.0)
+    assert ctl.estimated_wait() == 0
+    ctl.inflight, ctl.waiting = 2, 3
+    assert ctl.estimated_wait() == 2.0
+
+def test_inflated_estimate_decays_while_idle():
+    ctl = AdmissionController(initial_service_s=1.0, decay_half_life_s=30)
+    ctl.record_service_time(60, now=0.0)
+    ctl.record_service_time(60, now=0.0)
+    assert ctl.service_estimate(now=0.0) > 20
+    assert abs(ctl.service_estimate(now=30.0) - (1 + (ctl.service_ewma_s - 1) / 2)) < 1e-9
+    assert ctl.service_estimate(now=600.0) < 1.01
+
+def _run(app, deadline_ms: str = "15000"):
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        "type": "http", "method": "POST", "path": "/recycle/classify",
+        "headers": [(b"x-request-deadline-ms", deadline_ms.encode())], "client": ("127.0.0.1", 1),
+    }
+    asyncio.run(app(scope, receive, send))
+    return sent[0]["status"]
+
+async def _ok(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"{}"})
+
+def test_idle_request_is_admitted_after_slow_samples():
+    ctl = AdmissionController(burst=100)
+    ctl.record_service_time(60)
+    ctl.record_service_time(60)
+    app = AdmissionMiddleware(_ok, controller=ctl)
+
+    assert _run(app) == 200  # probe despite a ~22s estimate vs a 15s budget
+    assert ctl.service_ewma_s < 20
+
+def test_busy_request_over_budget_is_shed():
+    ctl = AdmissionController(max_concurrency=1, burst=100)
+    ctl.record_service_time(60)
+    ctl.inflight = 1  # someone else is running
+    app = AdmissionMiddleware(_ok, controller=ctl)
+
+    assert _run(app) == 503
@@ -0,0 +1,77 @@
+from datetime import date, timedelta
+
+from model.badges import (
+    compute_streak, current_streak, evaluate_badges, get_user_stats, rebuild_user_stats, seed_default_badges,
+)
+from model.connect import SessionLocal
+from model.model import Scan, ImpactDaily, UserBadge, UserStats
+
+def _badge_codes(db, user_id):
+    return {ub.badge.code for ub in db.query(UserBadge).filter(UserBadge.user_id == user_id)}
+
+def test_compute_streak_counts_consecutive_days_ending_today():
+    today = date(2026, 3, 10)
+    days = [today, today - timedelta(days=1), today - timedelta(days=2), today - timedelta(days=5)]
+    assert compute_streak(days, today) == 3
+    assert compute_streak([today - timedelta(days=1)], today) == 0
+
+def test_current_streak_is_zero_unless_scanned_today():
+    stats = UserStats(streak_days=4, last_scan_day=date.today() - timedelta(days=1))
+    assert current_streak(stats) == 0
+    stats.last_scan_day = date.today()
+    assert current_streak(stats) == 4
+
+def test_rebuild_counts_scans_materials_and_co2(db, user):
+    db.add_all([
+        Scan(user_id=user.id, predicted_material="Plastic"),
+        Scan(user_id=user.id, predicted_material="plastic "),
+        Scan(user_id=user.id, predicted_material="glass"),
+        ImpactDaily(user_id=user.id, day=date.today(), co2_saved_g=1500.0),
+    ])
+    db.commit()
+
+    stats = rebuild_user_stats(db, user.id)
+    assert stats.total_scans == 3
+    assert stats.co2_saved_g == 1500.0
+    assert stats.last_scan_day == date.today()
+    assert stats.streak_days == 1
+
+def test_evaluate_badges_awards_each_badge_once(db, user):
+    seed_default_badges(db)
+    db.add(Scan(user_id=user.id, predicted_material="metal"))
+    db.commit()
+
+    stats = get_user_stats(db, user.id)
+    assert _badge_codes(db, user.id) == {"FIRST_SCAN"}
+    assert evaluate_badges(db, user.id, stats) == []
+
+    stats.co2_saved_g = 25000
+    awarded = evaluate_badges(db, user.id, stats)
+    assert [badge.code for badge in awarded] == ["ECO_HERO"]
+
+def test_concurrent_first_read_reuses_committed_stats(db, user, monkeypatch):
+    seed_default_badges(db)
+    db.add(Scan(user_id=user.id, predicted_material="glass"))
+    db.commit()
+
+    # Another request builds and commits the counters first...
+    get_user_stats(db, user.id)
+
+    # ...while this one had already looked and seen none
+    other = SessionLocal()
+    real_get = other.get
+    stale_reads = [None, None]
+
+    def stale_get(entity, ident, **kw):
+        if entity is UserStats and stale_reads:
+            return stale_reads.pop()
+        return real_get(entity, ident, **kw)
+
+    monkeypatch.setattr(other, "get", stale_get)
+    try:
+        stats = get_user_stats(other, user.id)
+        assert stats.total_scans == 1
+        assert other.query(UserStats).count() == 1
+        assert _badge_codes(other, user.id) == {"FIRST_SCAN"}
+    finally:
+        other.close()
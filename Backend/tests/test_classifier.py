@@ -0,0 +1,17 @@
+import numpy as np
+import pytest
+
+from model.classifier import predict_probs
+
+def test_predict_probs_casts_input_to_half_precision_weights():
+    torch = pytest.importorskip("torch")
+    # Ultralytics checkpoints keep their weights in fp16
+    model = torch.nn.Sequential(
+        torch.nn.Conv2d(3, 4, 3), torch.nn.AdaptiveAvgPool2d(1), torch.nn.Flatten()
+    ).half().eval()
+
+    probs = predict_probs(model, np.zeros((3, 32, 32), dtype=np.float32))
+
+    assert probs.dtype == np.float32
+    assert probs.shape == (4,)
+    assert abs(float(probs.sum()) - 1.0) < 1e-3
@@ -0,0 +1,85 @@
+import asyncio
+import io
+import threading
+import time
+
+import numpy as np
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from routing import classify_stream
+from routing.admission import AdmissionController
+
+def _frame(size=(64, 48), fmt="JPEG"):
+    buf = io.BytesIO()
+    Image.new("RGB", size, (30, 160, 60)).save(buf, fmt)
+    return buf.getvalue()
+
+def _stream_client(monkeypatch, predict):
+    monkeypatch.setattr(classify_stream, "classify_controller", AdmissionController(max_concurrency=1))
+    monkeypatch.setattr(classify_stream, "CLASSIFY_STREAM_MAX_FPS", 1000)
+    monkeypatch.setattr(classify_stream, "_authenticate", lambda token: 1)
+    monkeypatch.setattr(classify_stream, "get_classifier", lambda: object())
+    monkeypatch.setattr(classify_stream, "class_names", lambda model: ["glass", "metal"])
+    monkeypatch.setattr(classify_stream, "predict_probs", predict)
+    app = FastAPI()
+    app.include_router(classify_stream.router)
+    return TestClient(app)
+
+def test_frame_size_counts_decoded_bytes():
+    assert classify_stream._frame_size(b"x" * 1000) == 1000
+    assert classify_stream._frame_size("A" * 1000) == 750
+
+def test_slot_is_held_until_the_inference_thread_finishes(monkeypatch):
+    ctl = AdmissionController(max_concurrency=1)
+    monkeypatch.setattr(classify_stream, "classify_controller", ctl)
+    gate = threading.Event()
+
+    async def scenario():
+        assert await ctl.try_acquire()
+        inference = asyncio.ensure_future(asyncio.to_thread(gate.wait))
+        inference.add_done_callback(classify_stream._release_when_done(time.monotonic()))
+        waiter = asyncio.ensure_future(asyncio.shield(inference))
+        await asyncio.sleep(0)
+        waiter.cancel()  # client disconnected mid-inference
+        await asyncio.sleep(0.05)
+        assert ctl.inflight == 1
+
+        gate.set()
+        await inference
+        await asyncio.sleep(0)
+        assert ctl.inflight == 0
+
+    asyncio.run(scenario())
+
+def test_non_jpeg_and_oversized_frames_are_refused_before_decoding(monkeypatch):
+    calls = []
+    client = _stream_client(monkeypatch, lambda model, x: calls.append(x) or np.array([0.9, 0.1]))
+    monkeypatch.setattr(classify_stream, "CLASSIFY_STREAM_MAX_PIXELS", 100 * 100)
+
+    with client.websocket_connect("/classify/stream?token=t") as ws:
+        ws.send_bytes(_frame(fmt="PNG"))
+        assert ws.receive_json()["type"] == "error"
+        ws.send_bytes(_frame(size=(200, 200)))
+        assert "too large" in ws.receive_json()["detail"]
+        ws.send_bytes(_frame())
+        assert ws.receive_json()["type"] == "prediction"
+    assert len(calls) == 1
+
+def test_inference_error_is_reported_and_the_stream_continues(monkeypatch):
+    outcomes = [RuntimeError("Input type (float) and bias type (Half)"), np.array([0.2, 0.8])]
+
+    def predict(model, x):
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    client = _stream_client(monkeypatch, predict)
+    with client.websocket_connect("/classify/stream?token=t") as ws:
+        ws.send_bytes(_frame())
+        assert ws.receive_json() == {"type": "error", "detail": "Could not classify frame"}
+        ws.send_bytes(_frame())
+        message = ws.receive_json()
+        assert message["type"] == "prediction" and message["item_type"] == "metal"
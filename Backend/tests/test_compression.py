@@ -0,0 +1,66 @@
+import asyncio
+import gzip
+
+import pytest
+
+from routing import compression
+from routing.compression import CompressionMiddleware, choose_encoding
+
+@pytest.fixture
+def gzip_only(monkeypatch):
+    monkeypatch.setattr(compression, "brotli", None)
+
+def test_choose_encoding_honours_q_values(gzip_only):
+    assert choose_encoding("gzip") == "gzip"
+    assert choose_encoding("gzip;q=0") is None
+    assert choose_encoding("identity") is None
+    assert choose_encoding("*") == "gzip"
+    assert choose_encoding("*;q=0.1, gzip;q=0") is None  # explicitly refused
+    assert choose_encoding("GZIP; q=0.5, *;q=0") == "gzip"
+
+def test_choose_encoding_prefers_br_on_ties():
+    pytest.importorskip("brotli")
+    assert choose_encoding("gzip, br") == "br"
+    assert choose_encoding("gzip;q=1, br;q=0.5") == "gzip"
+    assert choose_encoding("*, br;q=0") == "gzip"
+
+def _call(body: bytes, accept: str = "gzip", status: int = 200, path: str = "/profile/x", chunks=None):
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": status, "headers": [
+            (b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()),
+        ]})
+        for chunk, more in (chunks or [(body, False)]):
+            await send({"type": "http.response.body", "body": chunk, "more_body": more})
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "path": path, "headers": [(b"accept-encoding", accept.encode())]}
+    asyncio.run(CompressionMiddleware(app, minimum_size=100)(scope, None, send))
+    headers = dict(sent[0]["headers"])
+    return headers, b"".join(m.get("body", b"") for m in sent[1:])
+
+def test_large_bodies_are_gzipped(gzip_only):
+    body = b'{"items": [' + b'"abc",' * 100 + b'"x"]}'
+    headers, out = _call(body)
+    assert headers[b"content-encoding"] == b"gzip"
+    assert headers[b"vary"] == b"Accept-Encoding"
+    assert int(headers[b"content-length"]) == len(out)
+    assert gzip.decompress(out) == body
+
+def test_small_refused_and_unlisted_responses_pass_through(gzip_only):
+    body = b'{"ok": true}'
+    assert _call(body)[1] == body
+    big = b"x" * 500
+    assert b"content-encoding" not in _call(big, accept="*;q=0.1, gzip;q=0")[0]
+    assert b"content-encoding" not in _call(big, status=304)[0]
+    assert b"content-encoding" not in _call(big, path="/auth/login")[0]
+
+def test_streamed_bodies_are_compressed_incrementally(gzip_only):
+    parts = [(b"a" * 300, True), (b"b" * 300, True), (b"", False)]
+    headers, out = _call(b"", chunks=parts)
+    assert headers[b"content-encoding"] == b"gzip"
+    assert b"content-length" not in headers
+    assert gzip.decompress(out) == b"a" * 300 + b"b" * 300
@@ -0,0 +1,81 @@
+import threading
+import time
+
+from model import geocoding
+from model.geocoding import (
+    GazetteerProvider, GeocodeCache, Geocoder, backfill_coordinates, cached_coordinates, normalize_address,
+    take_backfill_lock,
+)
+from model.model import RecyclingCenter, User
+
+class SlowProvider:
+    name = "slow"
+
+    def __init__(self, result=(1.0, 2.0)):
+        self.result = result
+        self.calls = 0
+
+    def geocode(self, address):
+        self.calls += 1
+        time.sleep(0.05)
+        return self.result
+
+def test_normalize_address():
+    assert normalize_address("  12 Main St.,Springfield ,  IL ") == "12 main st, springfield, il"
+    assert normalize_address("") is None
+
+def test_identical_lookups_share_one_provider_call(tmp_path):
+    provider = SlowProvider()
+    geocoder = Geocoder(provider, GeocodeCache(str(tmp_path / "cache.sqlite3")))
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(geocoder.geocode("1 Elm St"))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert provider.calls == 1
+    assert results == [(1.0, 2.0)] * 8
+    assert geocoder.cached("1 ELM ST.") == (1.0, 2.0)
+
+def test_unresolved_addresses_are_cached_as_negative(tmp_path):
+    provider = SlowProvider(result=None)
+    geocoder = Geocoder(provider, GeocodeCache(str(tmp_path / "cache.sqlite3")))
+    assert geocoder.geocode("nowhere") is None
+    assert geocoder.geocode("nowhere") is None
+    assert provider.calls == 1
+
+def test_gazetteer_falls_back_to_the_town(tmp_path):
+    path = tmp_path / "places.csv"
+    path.write_text('address,latitude,longitude\n"Springfield, IL",39.78,-89.65\n', encoding="utf-8")
+    provider = GazetteerProvider(str(path))
+    assert provider.geocode("12 Main St, Springfield, IL") == (39.78, -89.65)
+    assert provider.geocode("Atlantis") is None
+
+def test_cached_coordinates_never_raises(monkeypatch):
+    def broken():
+        raise OSError("read-only file system")
+
+    monkeypatch.setattr(geocoding, "get_geocode_cache", broken)
+    assert cached_coordinates("1 Elm St") is None
+
+def test_only_one_holder_of_the_backfill_lock(tmp_path):
+    path = str(tmp_path / "backfill.lock")
+    first = take_backfill_lock(path)
+    assert first
+    assert take_backfill_lock(path) is None
+    first.close()
+    assert take_backfill_lock(path)
+
+def test_backfill_fills_users_and_centers(db, tmp_path):
+    db.add_all([
+        User(name="a", email="a@example.com", password_hash="x", address="1 Elm St"),
+        RecyclingCenter(name="Depot", address="2 Oak Ave"),
+        RecyclingCenter(name="Known", address="3 Pine Rd", latitude=5.0, longitude=6.0),
+    ])
+    db.commit()
+    geocoder = Geocoder(SlowProvider(), GeocodeCache(str(tmp_path / "cache.sqlite3")))
+
+    assert backfill_coordinates(db, geocoder, batch_size=1) == {"users": (1, 0), "recycling_centers": (1, 0)}
+    assert db.query(RecyclingCenter).filter_by(name="Known").one().latitude == 5.0
+    assert db.query(User).one().latitude == 1.0
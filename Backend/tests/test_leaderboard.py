@@ -0,0 +1,56 @@
+from model import leaderboard
+from model.connect import SessionLocal
+from model.model import LeaderboardWeekly
+
+def _notifications(monkeypatch):
+    calls = []
+    monkeypatch.setattr(leaderboard, "notify_leaderboard_changed", lambda: calls.append(True))
+    return calls
+
+def _entry(user, points=10, rank=1):
+    return LeaderboardWeekly(user_id=user.id, week_start=leaderboard.current_week_start(), points=points, rank=rank)
+
+def test_committed_leaderboard_write_notifies_once(db, user, monkeypatch):
+    calls = _notifications(monkeypatch)
+    db.add(_entry(user))
+    db.flush()
+    assert calls == []
+    db.commit()
+    assert calls == [True]
+
+    db.commit()  # nothing changed since
+    assert calls == [True]
+
+def test_bulk_update_notifies_after_commit(db, user, monkeypatch):
+    db.add(_entry(user))
+    db.commit()
+    calls = _notifications(monkeypatch)
+
+    db.query(LeaderboardWeekly).filter(LeaderboardWeekly.user_id == user.id).update({"points": 20})
+    db.commit()
+    assert calls == [True]
+
+def test_savepoint_and_rollback_do_not_notify(db, user, monkeypatch):
+    calls = _notifications(monkeypatch)
+    with db.begin_nested():
+        db.add(_entry(user))
+    assert calls == []
+    db.rollback()
+    db.commit()
+    assert calls == []
+
+def test_refreshed_snapshot_is_cached_for_the_ttl(db, user, monkeypatch):
+    db.add(_entry(user))
+    db.commit()
+    loads = []
+    load_top = leaderboard._load_top
+    monkeypatch.setattr(leaderboard, "_load_top", lambda *args: loads.append(True) or load_top(*args))
+
+    session = SessionLocal()
+    try:
+        version, top = leaderboard.get_top_snapshot(session, refresh=True)
+        assert leaderboard.get_top_snapshot(session) == (version, top)
+    finally:
+        session.close()
+    assert len(loads) == 1
+    assert top[0]["points"] == 10
@@ -0,0 +1,67 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+
+from routing import auth
+from model.model import PasswordResetToken
+
+@pytest.fixture
+def sent(monkeypatch):
+    """Reset tokens that would have been emailed"""
+    tokens = []
+    monkeypatch.setattr(auth, "send_reset_email", lambda email, token: tokens.append(token) or True)
+    return tokens
+
+def _forgot(db, email):
+    return asyncio.run(auth.forgot_password(auth.ForgotPasswordRequest(email=email), db))
+
+def _reset(db, token, password="new-password"):
+    return asyncio.run(auth.reset_password(auth.ResetPasswordRequest(token=token, new_password=password), db))
+
+def test_only_the_token_digest_is_stored(db, user, sent):
+    _forgot(db, user.email)
+
+    row = db.query(PasswordResetToken).one()
+    assert row.token_hash == auth.hash_reset_token(sent[0])
+    assert sent[0] not in (row.token_hash, user.reset_token)
+
+def test_new_request_revokes_the_previous_token(db, user, sent):
+    _forgot(db, user.email)
+    _forgot(db, user.email)
+
+    assert db.query(PasswordResetToken).count() == 1
+    with pytest.raises(HTTPException):
+        _reset(db, sent[0])
+
+def test_reset_token_is_single_use(db, user, sent):
+    _forgot(db, user.email)
+    _reset(db, sent[0])
+
+    db.refresh(user)
+    assert auth.verify_password("new-password", user.password_hash)
+    assert db.query(PasswordResetToken).count() == 0
+    with pytest.raises(HTTPException) as exc:
+        _reset(db, sent[0], "another-password")
+    assert exc.value.status_code == 400
+
+def test_expired_token_is_rejected(db, user, sent):
+    _forgot(db, user.email)
+    db.query(PasswordResetToken).update({"expires_at": datetime.utcnow() - timedelta(seconds=1)})
+    db.commit()
+
+    with pytest.raises(HTTPException) as exc:
+        _reset(db, sent[0])
+    assert exc.value.status_code == 400
+
+def test_purge_deletes_only_expired_tokens(db, user):
+    now = datetime.utcnow()
+    db.add_all([
+        PasswordResetToken(user_id=user.id, token_hash="a" * 64, expires_at=now - timedelta(minutes=1)),
+        PasswordResetToken(user_id=user.id, token_hash="b" * 64, expires_at=now + timedelta(hours=1)),
+    ])
+    db.commit()
+
+    assert auth.purge_expired_reset_tokens(db) == 1
+    assert [row.token_hash for row in db.query(PasswordResetToken)] == ["b" * 64]
@@ -0,0 +1,45 @@
+import io
+import struct
+import zlib
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from model.preprocess import TensorBufferPool, load_image, preprocess_bytes
+
+def _png_header(width, height):
+    """A PNG that only declares its size; opening it never decodes pixels"""
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+    ihdr = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", ihdr) + chunk(b"IDAT", zlib.compress(b"")) + chunk(b"IEND", b"")
+
+def _encode(size, fmt):
+    buf = io.BytesIO()
+    Image.new("RGB", size, (200, 40, 40)).save(buf, fmt)
+    return buf.getvalue()
+
+def test_preprocess_bytes_normalizes_into_the_pool_shape():
+    pool = TensorBufferPool(size=1, input_size=32)
+    with preprocess_bytes(_encode((64, 48), "JPEG"), pool) as x:
+        assert x.shape == (3, 32, 32) and x.dtype == np.float32
+        assert 0.0 <= float(x.min()) and float(x.max()) <= 1.0
+
+def test_oversized_image_is_rejected_from_its_header():
+    with pytest.raises(ValueError, match="too large"):
+        load_image(_png_header(6000, 6000))
+
+def test_decompression_bomb_is_a_value_error(monkeypatch):
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 1000)
+    with pytest.raises(ValueError, match="Unreadable"):
+        load_image(_encode((100, 100), "PNG"), max_pixels=10**9)
+
+def test_formats_restricts_what_is_decoded():
+    with pytest.raises(ValueError, match="Unreadable"):
+        load_image(_encode((64, 64), "PNG"), formats=["JPEG"])
+    assert load_image(_encode((64, 64), "JPEG"), input_size=32, formats=["JPEG"]).size == (32, 32)
+
+def test_garbage_is_a_value_error():
+    with pytest.raises(ValueError):
+        load_image(b"not an image")
@@ -0,0 +1,46 @@
+from datetime import datetime, timedelta
+import gzip
+import json
+import os
+
+from model.badges import get_user_stats, rebuild_user_stats
+from model.model import Scan, ScanRollupDaily, UserMaterialStats
+from model.retention import compact_scans
+
+def _material_counts(db, user_id):
+    return {
+        row.material: row.scans
+        for row in db.query(UserMaterialStats).filter(UserMaterialStats.user_id == user_id)
+    }
+
+def test_compaction_keeps_totals_and_archives_rows(db, user, tmp_path):
+    user_id = user.id  # compaction expunges the session
+    now = datetime.utcnow()
+    old = [now - timedelta(days=120), now - timedelta(days=120), now - timedelta(days=95)]
+    db.add_all([Scan(user_id=user_id, predicted_material="Plastic", created_at=at) for at in old])
+    db.add(Scan(user_id=user_id, predicted_material="glass", created_at=now))
+    db.commit()
+
+    before = rebuild_user_stats(db, user_id)
+    totals = (before.total_scans, before.streak_days, before.last_scan_day)
+    materials = _material_counts(db, user_id)
+    db.commit()
+
+    assert compact_scans(db, older_than_days=90, archive_dir=str(tmp_path), batch_size=2) == 3
+
+    assert db.query(Scan).count() == 1
+    assert sum(r.scans for r in db.query(ScanRollupDaily)) == 3
+
+    stats = get_user_stats(db, user_id)
+    assert (stats.total_scans, stats.streak_days, stats.last_scan_day) == totals  # counters untouched
+
+    after = rebuild_user_stats(db, user_id)
+    assert (after.total_scans, after.streak_days, after.last_scan_day) == totals
+    assert _material_counts(db, user_id) == materials
+
+    archived = []
+    for name in sorted(os.listdir(tmp_path)):
+        with gzip.open(tmp_path / name, "rt", encoding="utf-8") as f:
+            archived += [json.loads(line) for line in f]
+    assert len(archived) == 3
+    assert {row["predicted_material"] for row in archived} == {"Plastic"}
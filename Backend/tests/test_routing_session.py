@@ -0,0 +1,75 @@
+import asyncio
+import time
+
+import pytest
+from sqlalchemy import text
+
+from model import connect
+from model.connect import SessionLocal, ReplicaPool, WriteWindow, current_write_window, engine, use_replica
+from model.model import User
+from routing.consistency import ReadYourWritesMiddleware, READ_YOUR_WRITES_HEADER
+
+@pytest.fixture
+def replica(tmp_path, monkeypatch):
+    """A replica with no tables at all, like an unseeded sqlite:///replica.db"""
+    pool = ReplicaPool([f"sqlite:///{tmp_path / 'replica.db'}"])
+    monkeypatch.setattr(connect, "replicas", pool)
+    monkeypatch.setattr(connect, "_recent_writers", {})
+    return pool.engines[0]
+
+def test_reads_stay_on_primary_without_opt_in(db, replica):
+    assert db.get_bind() is engine
+
+def test_opted_in_reads_use_a_replica_until_the_session_writes(db, replica):
+    use_replica(db)
+    assert db.get_bind() is replica
+    db.add(User(name="W", email="w@example.com", password_hash="x"))
+    db.flush()
+    assert db.get_bind() is engine
+
+def test_recent_writer_reads_from_primary(db, replica, user):
+    writer = SessionLocal()
+    writer.info["user_id"] = user.id
+    writer.get(User, user.id).name = "Renamed"
+    writer.commit()
+    writer.close()
+
+    reader = use_replica(SessionLocal(), user.id)
+    try:
+        assert reader.get_bind() is engine
+    finally:
+        reader.close()
+
+def test_client_write_window_reads_from_primary(db, replica):
+    token = current_write_window.set(WriteWindow(time.time() + 5))
+    try:
+        assert use_replica(db).get_bind() is engine
+    finally:
+        current_write_window.reset(token)
+
+def test_failed_replica_read_falls_back_to_primary(db, replica, user):
+    use_replica(db)
+    assert db.get_bind() is replica
+    assert db.query(User).filter(User.email == "tester@example.com").one().name == "Tester"
+    assert connect.replicas.is_down(replica)
+    assert db.execute(text("SELECT count(*) FROM users")).scalar() == 1
+
+def test_write_window_round_trips_through_the_header():
+    responses = []
+
+    async def app(scope, receive, send):
+        connect._record_write(None)  # what the after_commit hook does
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def send(message):
+        responses.append(message)
+
+    far_future = str(time.time() + 3600).encode()
+    scope = {"type": "http", "headers": [(READ_YOUR_WRITES_HEADER.lower().encode(), far_future)]}
+    asyncio.run(ReadYourWritesMiddleware(app)(scope, None, send))
+
+    headers = dict(responses[0]["headers"])
+    until = float(headers[READ_YOUR_WRITES_HEADER.lower().encode()])
+    assert time.time() < until <= time.time() + connect.READ_YOUR_WRITES_SECONDS
+    assert current_write_window.get() is None
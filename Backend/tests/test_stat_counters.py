@@ -0,0 +1,87 @@
+from datetime import date
+
+from model.badges import get_user_stats, seed_default_badges
+from model.connect import SessionLocal
+from model.model import Scan, ImpactDaily, Badge, UserBadge, UserStats, UserMaterialStats
+
+def _write(*rows):
+    """Insert rows the way a route would: its own session, add, commit"""
+    session = SessionLocal()
+    try:
+        session.add_all(rows)
+        session.commit()
+    finally:
+        session.close()
+
+def _stats(user_id):
+    session = SessionLocal()
+    try:
+        stats = get_user_stats(session, user_id)
+        session.refresh(stats)
+        session.expunge(stats)  # keep the loaded values readable after close
+        return stats
+    finally:
+        session.close()
+
+def test_scan_after_first_read_updates_counters_and_version(db, user):
+    seed_default_badges(db)
+    before = _stats(user.id)
+    assert before.total_scans == 0
+
+    _write(Scan(user_id=user.id, predicted_material="Glass"))
+
+    after = _stats(user.id)
+    assert after.total_scans == 1
+    assert after.streak_days == 1
+    assert after.last_scan_day == date.today()
+    assert after.version > before.version
+    assert db.query(UserMaterialStats.scans).filter_by(user_id=user.id, material="glass").scalar() == 1
+    assert db.query(UserBadge).filter_by(user_id=user.id).count() == 1  # FIRST_SCAN
+
+def test_first_scan_builds_counters_once(db, user):
+    _write(Scan(user_id=user.id), Scan(user_id=user.id))
+    assert _stats(user.id).total_scans == 2
+
+def test_scan_awards_material_badge_with_unnormalized_rule(db, user):
+    db.add(Badge(code="GLASS_1", name="Glass", rule_type="material", rule_material=" Glass", threshold=1))
+    db.commit()
+    _stats(user.id)
+
+    _write(Scan(user_id=user.id, predicted_material="glass"))
+
+    assert [ub.badge.code for ub in db.query(UserBadge).filter_by(user_id=user.id)] == ["GLASS_1"]
+
+def test_impact_rows_add_co2(db, user):
+    _stats(user.id)
+    _write(ImpactDaily(user_id=user.id, day=date.today(), co2_saved_g=300.0))
+
+    session = SessionLocal()
+    row = session.query(ImpactDaily).filter_by(user_id=user.id).one()
+    row.co2_saved_g += 200.0
+    session.commit()
+    session.close()
+
+    assert _stats(user.id).co2_saved_g == 500.0
+
+def test_rolled_back_scan_is_not_counted(db, user):
+    _stats(user.id)
+    session = SessionLocal()
+    session.add(Scan(user_id=user.id))
+    session.flush()
+    session.rollback()
+    session.commit()
+    session.close()
+
+    assert _stats(user.id).total_scans == 0
+
+def test_rebuild_within_writer_transaction_is_not_double_counted(db, user):
+    session = SessionLocal()
+    session.add(Scan(user_id=user.id))
+    session.flush()
+    assert get_user_stats(session, user.id).total_scans == 1  # builds from history and commits
+    session.add(Scan(user_id=user.id))
+    session.commit()
+    session.close()
+
+    assert _stats(user.id).total_scans == 2
+    assert db.query(UserStats).count() == 1
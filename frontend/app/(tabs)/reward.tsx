@@ -52,6 +52,22 @@ const Rewards = () => {
   const [leaderboard, setLeaderboard] = useState<LeaderboardEntry[]>([]);
   const [milestones, setMilestones] = useState<Milestone[]>([]);
 
+  // Keep the leaderboard live without polling
+  useEffect(() => {
+    let cancelled = false;
+    let unsubscribe: (() => void) | null = null;
+    apiService.initializeToken().then(() => {
+      // Unmounted while the token loaded: don't open a socket nobody will close
+      if (!cancelled) {
+        unsubscribe = apiService.subscribeLeaderboard(setLeaderboard);
+      }
+    });
+    return () => {
+      cancelled = true;
+      unsubscribe?.();
+    };
+  }, []);
+
   useEffect(() => {
     const fetchRewardsData = async () => {
       try {
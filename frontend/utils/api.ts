@@ -7,6 +7,8 @@ const API_BASE_URL = 'https://333c83a1b1f4.ngrok-free.app'; // Development
 // const API_BASE_URL = 'https://f91813e1e894.ngrok-free.app'; // Production fallback
 // const API_BASE_URL = 'http://192.168.1.XXX:8000'; // Your computer's IP for physical device
 
+const CLASSIFY_DEADLINE_MS = 15000;
+
 interface LoginData {
   email: string;
   password: string;
@@ -84,6 +86,22 @@ interface Milestone {
   reward: string;
 }
 
+type LeaderboardMessage =
+  | { type: 'snapshot'; top: LeaderboardEntry[]; you: { rank: number | null; points: number | null } }
+  | { type: 'top_diff'; size: number; upserts: (LeaderboardEntry & { slot: number })[] }
+  | { type: 'you'; rank: number | null; points: number | null };
+
+type ClassifyStreamMessage =
+  | { type: 'prediction'; item_type: string; confidence: number; frames_dropped: number }
+  | { type: 'result'; item_type: string; confidence: number }
+  | { type: 'error'; detail: string };
+
+interface ClassifyStream {
+  // Low-resolution JPEG frame, base64 (as returned by takePictureAsync) or raw bytes
+  sendFrame: (frame: string | ArrayBuffer) => void;
+  close: () => void;
+}
+
 interface ClassificationRequest {
   image_data: string;
 }
@@ -98,8 +116,17 @@ interface ClassificationResponse {
   image_path?: string;
 }
 
+interface CachedResponse {
+  etag: string;
+  body: unknown;
+}
+
 class ApiService {
   private token: string | null = null;
+  // Last body + ETag per GET endpoint, revalidated with If-None-Match
+  private etagCache = new Map<string, CachedResponse>();
+  // Echoed back until it passes so reads after a write see it on any server worker
+  private readYourWritesUntil: string | null = null;
   onAuthError: (() => void) | null = null;
 
   async initializeToken(): Promise<string | null> {
@@ -118,6 +145,7 @@ class ApiService {
 
   async clearToken() {
     this.token = null;
+    this.etagCache.clear();
     await SecureStore.deleteItemAsync('authToken');
   }
 
@@ -135,11 +163,29 @@ class ApiService {
       headers.Authorization = `Bearer ${this.token}`;
     }
 
+    const isGet = !options.method || options.method.toUpperCase() === 'GET';
+    const cached = isGet ? this.etagCache.get(endpoint) : undefined;
+    if (cached) {
+      headers['If-None-Match'] = cached.etag;
+    }
+    if (this.readYourWritesUntil && Number(this.readYourWritesUntil) * 1000 > Date.now()) {
+      headers['X-Read-Your-Writes-Until'] = this.readYourWritesUntil;
+    }
+
     const response = await fetch(url, {
       ...options,
       headers,
     });
 
+    const writeWindow = response.headers.get('X-Read-Your-Writes-Until');
+    if (writeWindow) {
+      this.readYourWritesUntil = writeWindow;
+    }
+
+    if (response.status === 304 && cached) {
+      return cached.body as T;
+    }
+
     if (!response.ok) {
       if (response.status === 401) {
         if (this.onAuthError) this.onAuthError();
@@ -149,7 +195,15 @@ class ApiService {
       throw new Error(error || `HTTP ${response.status}`);
     }
 
-    return response.json();
+    const body = await response.json();
+    const etag = response.headers.get('ETag');
+    if (isGet && etag) {
+      this.etagCache.set(endpoint, { etag, body });
+    } else if (!isGet) {
+      // Writes may change any cached view
+      this.etagCache.clear();
+    }
+    return body;
   }
 
   async login(data: LoginData): Promise<AuthResponse> {
@@ -198,10 +252,31 @@ class ApiService {
   async classifyItem(imageData: string): Promise<ClassificationResponse> {
     return this.request<ClassificationResponse>('/recycle/classify', {
       method: 'POST',
+      // Budget the server uses to shed the request early (503) instead of queueing it
+      headers: { 'X-Request-Deadline-Ms': String(CLASSIFY_DEADLINE_MS) },
       body: JSON.stringify({ image_data: imageData }),
     });
   }
 
+  // Live camera classification: the server keeps only the newest frame and
+  // emits a `result` once the smoothed prediction is stable
+  openClassifyStream(onMessage: (message: ClassifyStreamMessage) => void): ClassifyStream {
+    const wsBase = API_BASE_URL.replace(/^http/, 'ws');
+    const socket = new WebSocket(
+      `${wsBase}/recycle/classify/stream?token=${encodeURIComponent(this.token ?? '')}`
+    );
+    socket.onmessage = (event) => onMessage(JSON.parse(event.data));
+
+    return {
+      sendFrame: (frame) => {
+        if (socket.readyState === WebSocket.OPEN) {
+          socket.send(frame);
+        }
+      },
+      close: () => socket.close(),
+    };
+  }
+
   async healthCheck(): Promise<{ status: string }> {
     return this.request<{ status: string }>('/health');
   }
@@ -218,10 +293,48 @@ class ApiService {
     return this.request<LeaderboardEntry[]>('/profile/rewards/leaderboard');
   }
 
+  // Live leaderboard pushed over WebSocket; returns an unsubscribe function
+  subscribeLeaderboard(onChange: (entries: LeaderboardEntry[]) => void): () => void {
+    const wsBase = API_BASE_URL.replace(/^http/, 'ws');
+    const socket = new WebSocket(
+      `${wsBase}/profile/rewards/leaderboard/live?token=${encodeURIComponent(this.token ?? '')}`
+    );
+    let top: LeaderboardEntry[] = [];
+    let you: { rank: number | null; points: number | null } = { rank: null, points: null };
+
+    const emit = () => {
+      const entries = [...top];
+      // Same shape as GET /rewards/leaderboard: own row appended when outside the top 10
+      if (you.rank !== null && you.rank > 10) {
+        entries.push({ rank: you.rank, name: 'You', points: you.points ?? 0, avatar: '🏆' });
+      }
+      onChange(entries);
+    };
+
+    socket.onmessage = (event) => {
+      const message: LeaderboardMessage = JSON.parse(event.data);
+      if (message.type === 'snapshot') {
+        top = message.top;
+        you = message.you;
+      } else if (message.type === 'top_diff') {
+        const next = top.slice(0, message.size);
+        for (const { slot, ...entry } of message.upserts) {
+          next[slot] = entry;
+        }
+        top = next;
+      } else if (message.type === 'you') {
+        you = { rank: message.rank, points: message.points };
+      }
+      emit();
+    };
+
+    return () => socket.close();
+  }
+
   async getMilestones(): Promise<Milestone[]> {
     return this.request<Milestone[]>('/profile/rewards/milestones');
   }
 }
 
 export const apiService = new ApiService();
-export type { LoginData, SignupData, AuthResponse, UserProfile, ClassificationRequest, ClassificationResponse, CompleteProfileData, ProfileStatusResponse };
\ No newline at end of file
+export type { ClassifyStream, ClassifyStreamMessage, LoginData, SignupData, AuthResponse, UserProfile, ClassificationRequest, ClassificationResponse, CompleteProfileData, ProfileStatusResponse };
\ No newline at end of file